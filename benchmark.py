@@ -0,0 +1,369 @@
+import os
+import re
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from datetime import date, timedelta
+
+# Offline benchmark of the non-LLM hot paths and of the cold import time of the entry modules. The Gemini model is replaced by a stand-in replaying the agent
+# outputs recorded in evaluation_logs/benchmark_recording.json (with simulated Google Search grounding), so no
+# API key or network is needed. Results can be saved as a baseline and later runs fail on regressions.
+#
+# A new recording is exported from the LLM cache after a real run:
+#   CROWDBREW_LLM_CACHE=record python main.py --dates 2025-09-27
+#   python benchmark.py --record-from-cache
+
+# Benchmarks never touch the real cache, database or metrics files
+os.environ.setdefault("CROWDBREW_LLM_CACHE", "off")
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+_WORK_DIR = tempfile.mkdtemp(prefix="crowdbrew_bench_")
+
+from google.genai import types
+from google.adk.agents import LlmAgent
+from google.adk.models import LlmResponse
+from google.adk.models.base_llm import BaseLlm
+
+import main
+from crowdbrew_agent import agent as agent_module
+from crowdbrew_agent import database, llm_cache, metrics, parsing
+
+database.DB_NAME = os.path.join(_WORK_DIR, "bench.db")
+metrics.METRICS_FILE = os.path.join(_WORK_DIR, "metrics.jsonl")
+
+RECORDING_PATH = os.path.join("evaluation_logs", "benchmark_recording.json")
+DEFAULT_BASELINE = os.path.join("evaluation_logs", "benchmark_baseline.json")
+
+# A run fails when a p50 gets slower than the baseline by more than this fraction
+REGRESSION_THRESHOLD = 0.25
+
+# Entry modules timed by the import benchmark, and the cold import time the light ones must stay under
+# (crowdbrew_agent.agent loads google.adk and is only reported)
+IMPORT_TARGETS = ("main", "jobs", "crowdbrew_agent.search", "crowdbrew_agent.agent")
+LIGHT_IMPORTS = ("main", "jobs", "crowdbrew_agent.search")
+IMPORT_BUDGET_SECONDS = 1.0
+
+
+# --- STAND-IN MODEL ---
+RECORDED_AGENTS = ("research_agent", "impact_agent", "marketing_agent")
+
+
+def load_recording(path=RECORDING_PATH):
+    """Reads the raw output of every agent from the recording ({agent name: response text})."""
+    with open(path, encoding="utf-8") as file:
+        outputs = json.load(file)
+    for agent_name in RECORDED_AGENTS:
+        if not outputs.get(agent_name):
+            raise ValueError(f"No {agent_name} output in {path}")
+    return outputs
+
+
+def record_from_cache(path=RECORDING_PATH, cache_path=None):
+    """Writes a new recording from the latest responses stored in the LLM cache.
+
+    The bundles of the marketing agents (marketing_agent_1, _2, ...) are joined into one "output" list.
+    """
+    conn = database.get_connection(cache_path or llm_cache.CACHE_DB_NAME)
+    rows = conn.execute("SELECT agent, response FROM Responses ORDER BY created_at").fetchall()
+    latest = {agent_name: LlmResponse.model_validate_json(response) for agent_name, response in rows}
+
+    def text(agent_name):
+        content = latest[agent_name].content
+        return "".join(part.text or "" for part in (content.parts if content else []))
+
+    outputs = {agent_name: text(agent_name) for agent_name in RECORDED_AGENTS[:2] if agent_name in latest}
+    bundles = []
+    for agent_name in sorted(name for name in latest if re.fullmatch(r"marketing_agent_\d+", name)):
+        bundles.extend(parsing.extract_json(text(agent_name), "output")["output"])
+    if bundles:
+        outputs["marketing_agent"] = json.dumps({"output": bundles}, indent=4, ensure_ascii=False)
+
+    missing = [agent_name for agent_name in RECORDED_AGENTS if agent_name not in outputs]
+    if missing:
+        raise ValueError(f"No cached response of {', '.join(missing)} (run the agents in the record mode first)")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(outputs, file, indent=2, ensure_ascii=False)
+    return outputs
+
+
+def instruction_text(llm_request):
+    return str(llm_request.config.system_instruction or "") if llm_request.config else ""
+
+
+class ReplayLlm(BaseLlm):
+    """Serves the recorded responses, choosing the agent by its instruction.
+
+    Marketing slots get their own bundle of the recorded output, agents with google_search
+    get simulated grounding metadata, and every call can take a fixed latency.
+    """
+    model: str = "gemini-2.5-flash-lite"
+    outputs: dict = {}
+    latency: float = 0.0
+    calls: int = 0
+
+    def _reply(self, instruction):
+        slot = re.search(r"WYDARZENIA NR (\d+)", instruction)
+        if slot:
+            bundles = parsing.extract_json(self.outputs["marketing_agent"], "output")["output"]
+            number = int(slot.group(1))
+            return json.dumps({"output": bundles[number - 1:number]}, ensure_ascii=False), False
+        if "impact_summary" in instruction:
+            return self.outputs["impact_agent"], True
+        return self.outputs["research_agent"], True
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        instruction = instruction_text(llm_request)
+        text, searched = self._reply(instruction)
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            grounding_metadata=types.GroundingMetadata(web_search_queries=["wydarzenia Łódź"]) if searched else None,
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=len(instruction) // 4,
+                candidates_token_count=len(text) // 4,
+                total_token_count=(len(instruction) + len(text)) // 4,
+            ),
+        )
+
+
+def install_replay_model(latency=0.0):
+    """Replaces the model of every agent (and of the agents built later) with the replaying stand-in."""
+    replay = ReplayLlm(outputs=load_recording(), latency=latency)
+    agent_module.model = replay
+    pending = [agent_module.root_agent]
+    while pending:
+        current = pending.pop()
+        if isinstance(current, LlmAgent):
+            current.model = replay
+        pending.extend(current.sub_agents)
+    return replay
+
+
+# --- MEASUREMENTS ---
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {"p50_ms": round(pick(0.5) * 1000, 3), "p95_ms": round(pick(0.95) * 1000, 3),
+            "p99_ms": round(pick(0.99) * 1000, 3), "max_ms": round(ordered[-1] * 1000, 3)}
+
+
+async def bench_pipeline(runs, concurrency, latency):
+    """Full process_request path (stand-in model, real parsing and database writes)."""
+    install_replay_model(latency)
+    database.init_db()
+    base = date(2030, 1, 1)
+    queries = [(base + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(runs)]
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(query):
+        async with semaphore:
+            started = time.perf_counter()
+            items = await main.process_request(query, force_refresh=True)
+            samples.append(time.perf_counter() - started)
+            if len(items) != 3:
+                raise RuntimeError(f"Pipeline returned {len(items)} items for {query}")
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(one(query) for query in queries))
+    elapsed = time.perf_counter() - started
+    return {"runs": runs, "concurrency": concurrency, "runs_per_s": round(runs / elapsed, 2), **percentiles(samples)}
+
+
+def bench_extraction(copies, repeats):
+    """JSON extraction and validation on a large multi-date response."""
+    outputs = load_recording()
+    response = "\n".join(outputs["research_agent"] for _ in range(copies))
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        parsing.parse_stage_output(response, "research_summary")
+        samples.append(time.perf_counter() - started)
+    megabytes = len(response.encode("utf-8")) / 1024 / 1024
+    return {"size_mb": round(megabytes, 2), "mb_per_s": round(megabytes / (sum(samples) / len(samples)), 2),
+            **percentiles(samples)}
+
+
+_WORDS = ["Festiwal", "Koncert", "Targi", "Wystawa", "Maraton", "Jarmark", "Spektakl", "Kino", "Noc", "Gala",
+          "Jazz", "Rock", "Komiksu", "Designu", "Muzeów", "Światła", "Książki", "Piwa", "Kawy", "Sztuki"]
+
+
+def _synthetic_items(count, seed=7):
+    """Events in bundles of 3 per date, about every fifth one a near-duplicate of an event of the same date."""
+    rng = random.Random(seed)
+    items = []
+    day_names = []
+    base = date(2031, 1, 1)
+    for index in range(count):
+        event_date = (base + timedelta(days=index // 3)).strftime("%Y-%m-%d")
+        if index % 3 == 0:
+            day_names = []
+        if day_names and rng.random() < 0.2:
+            name = rng.choice(day_names).upper() + " 2031"
+        else:
+            name = f"{' '.join(rng.sample(_WORDS, 3))} {index}"
+            day_names.append(name)
+        items.append({
+            "event_date": event_date, "event_name": name, "location": "Łódź", "description": "Opis " * 10,
+            "impact_score": rng.randint(1, 100), "comments": "Benchmark",
+            "score_breakdown": {"frekwencja": 10, "zasięg": 10, "zgodność": 10, "różnorodność": 10, "optymizm": 10},
+            "facebook_post": "Wpadnijcie na kawę! " * 10,
+            "menu_items": [{"name": "Kawa", "desc": "Espresso", "type": "coffee"},
+                           {"name": "Ciasto", "desc": "Sernik", "type": "cake"}],
+        })
+    return items
+
+
+def bench_database(events):
+    """save_results() transactions and duplicate lookups over tens of thousands of events."""
+    database.init_db()
+    items = _synthetic_items(events)
+    batches = [items[index:index + 3] for index in range(0, len(items), 3)]
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for batch in batches:
+            batch_started = time.perf_counter()
+            database.save_results(batch)
+            samples.append(time.perf_counter() - batch_started)
+        elapsed = time.perf_counter() - started
+
+    lookups = []
+    cur = database.get_connection().cursor()
+    for item in random.Random(11).sample(items, min(2000, len(items))):
+        lookup_started = time.perf_counter()
+        database._find_duplicate(cur, item["event_date"], item["event_name"].lower())
+        lookups.append(time.perf_counter() - lookup_started)
+
+    return {"events": events, "events_per_s": round(events / elapsed, 1), "save": percentiles(samples),
+            "dedup_lookup": percentiles(lookups)}
+
+
+def bench_imports(repeats):
+    """Cold import time of the entry modules, each measured in a fresh interpreter."""
+    results = {"repeats": repeats}
+    root = os.path.dirname(os.path.abspath(__file__))
+    for module in IMPORT_TARGETS:
+        code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+        samples = []
+        for _ in range(repeats):
+            finished = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True,
+                                      check=True)
+            samples.append(float(finished.stdout.strip().splitlines()[-1]))
+        results[module] = percentiles(samples)
+    return results
+
+
+def slow_imports(results, budget=IMPORT_BUDGET_SECONDS):
+    """Light entry modules whose p50 cold import time is over the budget."""
+    return [f"{module}: {results[module]['p50_ms']} ms" for module in LIGHT_IMPORTS
+            if module in results and results[module]["p50_ms"] > budget * 1000]
+
+
+# --- REPORT ---
+def _p50s(results, prefix=""):
+    """Flattens every p50 of the results to {"section.p50_ms": value}."""
+    found = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            found.update(_p50s(value, f"{prefix}{key}."))
+        elif key == "p50_ms":
+            found[f"{prefix}{key}"] = value
+    return found
+
+
+# Parameters of a section - timings are only comparable when they are the same
+_PARAMETERS = ("runs", "concurrency", "size_mb", "events", "repeats")
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns the list of p50 regressions against the baseline (sections run with other parameters are skipped)."""
+    regressions = []
+    for section, old_results in baseline.items():
+        new_results = results.get(section)
+        if not new_results:
+            continue
+        if any(old_results.get(name) != new_results.get(name) for name in _PARAMETERS):
+            print(f"(i) {section}: different parameters than the baseline - not compared.")
+            continue
+        current = _p50s(new_results)
+        for key, old in _p50s(old_results).items():
+            new = current.get(key)
+            if new is not None and old and new > old * (1 + threshold):
+                regressions.append(f"{section}.{key}: {old} ms -> {new} ms (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CrowdBrew - offline benchmark (no API calls)")
+    parser.add_argument("--only", choices=["pipeline", "extraction", "database", "imports"], action="append",
+                        help="Run only these benchmarks")
+    parser.add_argument("--runs", type=int, default=50, help="Pipeline runs (one date each)")
+    parser.add_argument("--concurrency", type=int, default=5, help="Pipeline runs at once")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated latency of every model call (s)")
+    parser.add_argument("--copies", type=int, default=200, help="Copies of the recorded research output to parse")
+    parser.add_argument("--events", type=int, default=20000, help="Synthetic events written to the database")
+    parser.add_argument("--import-repeats", type=int, default=5, help="Fresh interpreters per timed import")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--record-from-cache", action="store_true",
+                        help=f"Write a new {RECORDING_PATH} from the latest responses in the LLM cache and exit")
+    args = parser.parse_args()
+
+    if args.record_from_cache:
+        record_from_cache()
+        print(f"💾 Recording saved to {RECORDING_PATH}")
+        sys.exit(0)
+
+    selected = args.only or ["pipeline", "extraction", "database", "imports"]
+    results = {}
+    if "pipeline" in selected:
+        print(f"⏱️ Pipeline: {args.runs} runs, {args.concurrency} at once...")
+        results["pipeline"] = asyncio.run(bench_pipeline(args.runs, args.concurrency, args.latency))
+    if "extraction" in selected:
+        print(f"⏱️ JSON extraction: {args.copies} copies of the research output...")
+        results["extraction"] = bench_extraction(args.copies, repeats=10)
+    if "database" in selected:
+        print(f"⏱️ Database: {args.events} events...")
+        results["database"] = bench_database(args.events)
+    if "imports" in selected:
+        print(f"⏱️ Cold imports: {args.import_repeats} fresh interpreters per module...")
+        results["imports"] = bench_imports(args.import_repeats)
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+
+    over_budget = slow_imports(results.get("imports", {}))
+    if over_budget:
+        print(f"❌ Imports over the {IMPORT_BUDGET_SECONDS}s budget (google.adk on the import path?):")
+        for entry in over_budget:
+            print(f"   {entry}")
+        sys.exit(1)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+        print(f"💾 Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        regressions = compare(results, json.load(open(args.baseline, encoding="utf-8")))
+        if regressions:
+            print("❌ Regressions against the baseline:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("✅ No regressions against the baseline.")
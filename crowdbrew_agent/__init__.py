@@ -1 +1,8 @@
-from . import agent
+import importlib
+
+
+def __getattr__(name):
+    # The agent module (and google.adk with it) is imported on first access, e.g. by adk web
+    if name == "agent":
+        return importlib.import_module(".agent", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
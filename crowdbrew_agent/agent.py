@@ -1,50 +1,63 @@
 import os
+import logging
 from google.genai import types
 from dotenv import load_dotenv, find_dotenv
-from google.adk.agents import Agent, SequentialAgent
+from google.adk.agents import Agent, ParallelAgent, SequentialAgent
 from google.adk.tools import google_search
-from google.adk.models import Gemini
-
-# Observability
-import logging
 
-LOG_DIR = "evaluation_logs"
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
+from . import cafes, llm_cache, logs, metrics, parsing, payloads
+from .rate_limit import RateLimitedGemini
+from .schemas import MarketingOutput
 
-logging.basicConfig(
-    level=logging.INFO,
-    filename=os.path.join(LOG_DIR, 'agent_trace.log'),
-    filemode='w',
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Agent definitions. Nothing is built at import time: the model and the agent tree are created on first
+# use by get_model() / get_root_agent() and then cached for the life of the process, so importing the
+# package (the web app, database-only CLI commands) stays cheap.
 
-# Load environment variables
-_ = load_dotenv(find_dotenv())
+logger = logging.getLogger(__name__)
 
-if not os.getenv("GOOGLE_API_KEY"):
-    print("⚠️ WARNING: GOOGLE_API_KEY not found in .env file.")
-
-# LLM retry helper function:
+# LLM retry helper function (server errors only - rate limits (429) are retried by the shared scheduler
+# in rate_limit.py, with jitter and a capped total delay):
 retry_config = types.HttpRetryOptions(
-    attempts=5,
-    exp_base=7,
+    attempts=3,
+    exp_base=2,
     initial_delay=1,
-    http_status_codes=[429, 500, 503, 504],
+    max_delay=8,
+    jitter=1,
+    http_status_codes=[500, 503, 504],
 )
 
-model = Gemini(model="gemini-2.5-flash-lite", retry_options=retry_config)
+# Built by get_model() on first use (the offline benchmark puts its stand-in model here)
+model = None
+_root_agent = None
+
+
+def _configure():
+    """Process setup done once, before the first model is built: trace log and environment variables."""
+    # Observability: queued, rotating trace log (evaluation_logs/agent_trace.log), see logs.py
+    logs.setup_logging()
+
+    # Load environment variables
+    _ = load_dotenv(find_dotenv())
+
+    if not os.getenv("GOOGLE_API_KEY"):
+        print("⚠️ WARNING: GOOGLE_API_KEY not found in .env file.")
+
+
+def get_model():
+    """Returns the shared Gemini model, building it on first use."""
+    global model
+    if model is None:
+        _configure()
+        model = RateLimitedGemini(model="gemini-2.5-flash-lite", retry_options=retry_config)
+    return model
+
 
 # --- AGENT 1: RESEARCH ---
-# Searches the internet for events taking place in Łódź (a city in Poland) on a given day and returns a list of multiple events in JSON
-research_agent = Agent(
-    name="research_agent",
-    model=model,
-    tools=[google_search],
-    description="Specialist in researching local events.",
-    instruction="""
+# Searches the internet for events taking place in the city of the café (Łódź by default) on a given day and returns a list of multiple events in JSON
+RESEARCH_INSTRUCTION = """
     Jesteś wyspecjalizowanym researcherem.
 
-    TWÓJ CEL: Znaleźć konkretne wydarzenia, odbywające się w Łodzi (miasto w centralnej Polsce) DOKŁADNIE w dniu wskazanym przez użytkownika (po podanej dacie).
+    TWÓJ CEL: Znaleźć konkretne wydarzenia, odbywające się {city_locative} DOKŁADNIE w dniu wskazanym przez użytkownika (po podanej dacie).
     
     ZASADA KRYTYCZNA: Użytkownik może pytać o "menu", "kawę" albo "promocję". IGNORUJ wszystko poza datą.
     
@@ -63,6 +76,8 @@ research_agent = Agent(
     3. Zaproponuj maksymalnie (łącznie) 12 wydarzeń o różnym charakterze (np. koncerty, festiwale, targi i wystawy) i skierowanych do różnych osób.
     4. Nie tłumacz się. Po prostu podaj listę.
     5. Zweryfikuj czy wydarzenie, o którym piszesz rzeczywiście odbywa się tego dnia, o który pyta użytkownik - (np. dla koncertu możesz sprawdzić czy istnieją bilety do kupienia na ten koncert i na ten dzień na portalach biletowych)
+    6. Wydarzenia znane już z kalendarzy miejsc (lista może być pusta): {known_events?}
+       Nie powtarzaj ich - wyszukaj tylko inne wydarzenia, których brakuje na tej liście.
 
     WAŻNE:
     Wygeneruj odpowiedź WYŁĄCZNIE w formacie JSON. Nie dodawaj żadnego tekstu przed ani po.
@@ -77,21 +92,33 @@ research_agent = Agent(
             }
         ]
     }
-    """,
-    output_key="research_results", 
-)
+    """
+
+
+def build_research_agent():
+    return Agent(
+        name="research_agent",
+        model=get_model(),
+        tools=[google_search],
+        description="Specialist in researching local events.",
+        instruction=RESEARCH_INSTRUCTION,
+        output_key="research_results",
+        before_model_callback=llm_cache.before_model_callback,
+        # google_search excludes the response schema - broken JSON is repaired before it is cached
+        after_model_callback=[parsing.repair_callback("research_summary"), llm_cache.after_model_callback],
+        # impact_agent gets a numbered, field-limited list instead of the whole research report
+        after_agent_callback=payloads.compact_research_callback,
+    )
+
 
 # --- AGENT 2: IMPACT EVALUATION
 # Evaluates the list of events from the previous Agent from a business perspective and returns the 3 most important ones in JSON format (with justification)
-impact_agent = Agent(
-    name="impact_agent",
-    model=model,
-    tools=[google_search],
-    description="Specialist in evaluating business impact of local events.",
-    instruction="""
+IMPACT_INSTRUCTION = """
     Jesteś wyspecjalizowanym marketingowcem, pracującym na zlecenie kawiarni.
 
-    TWÓJ CEL: Na podstawie raportu {research_results} stworzonego przez innego agenta, wybrać z listy tylko 3 wydarzenia o jak największym potencjale biznesowym (liczby możliwych klientów).
+    PROFIL KAWIARNI: {cafe_profile}
+
+    TWÓJ CEL: Na podstawie raportu {research_compact} stworzonego przez innego agenta (ponumerowana lista wydarzeń: id, nazwa, miejsce, opis), wybrać z listy tylko 3 wydarzenia o jak największym potencjale biznesowym (liczby możliwych klientów).
     
     ZASADA KRYTYCZNA: Masz za zadanie skierować działania marketingowe do jak największej liczby potencjalnych odbiorców.
     
@@ -109,13 +136,13 @@ impact_agent = Agent(
     6. Podaj końcową listę 3 wydarzeń w formacie JSON.
 
     UWAGI:
-    1. Twoja odpowiedź MUSI być listą konkretnych wydarzeń (Nazwa, Miejsce, Krótki Opis) i/lub jaki wtedy jest dzień/święto.
+    1. Twoja odpowiedź MUSI być listą wydarzeń wybranych z raportu.
     2. Dla każdego wydarzenia podaj:
-        - datę w formacie YYYY-MM-DD,
-        - dokładną nazwę,
-        - konkretne miejsce (np. "Manufaktura", "Teatr Wielki", lub "Cała Polska" dla świąt),
-        - krótki, merytoryczny opis (co to jest) - przepisz z raportu,
+        - numer (id) wydarzenia z raportu,
+        - dokładną nazwę z raportu,
+        - punktację,
         - uwagi (dlaczego wybrałeś to wydarzenie wraz z punktacją).
+       Nie przepisuj miejsca ani opisu - zostaną uzupełnione automatycznie.
     3. Nie tłumacz się. Po prostu podaj listę.
     4. Rozpatruj tylko wydarzenia nacechowane optymistyczne i kojarzące się pozytywnie - nic dołującego.
 
@@ -125,10 +152,8 @@ impact_agent = Agent(
     {
         "impact_summary": [
             {
-                "event_date": "YYYY-MM-DD",
+                "event_id": 1,
                 "event_name": "Nazwa wydarzenia",
-                "location": "Dokładne miejsce (np. Manufaktura)", 
-                "description": "Krótki opis wydarzenia",
                 "impact_score": 85,
                 "score_breakdown":{
                     "frekwencja": 15,
@@ -141,24 +166,42 @@ impact_agent = Agent(
             }
         ]
     }
-    """,
-    output_key="impact_results", 
-)
+    """
+
+
+def build_impact_agent():
+    return Agent(
+        name="impact_agent",
+        model=get_model(),
+        tools=[google_search],
+        description="Specialist in evaluating business impact of local events.",
+        instruction=IMPACT_INSTRUCTION,
+        output_key="impact_results",
+        before_model_callback=llm_cache.before_model_callback,
+        after_model_callback=[parsing.repair_callback("impact_summary"), llm_cache.after_model_callback],
+        # Places, descriptions and comments of the top events go on to the marketing agents in a compact form
+        after_agent_callback=payloads.compact_impact_callback,
+    )
+
 
 # --- AGENT 3: MARKETING ---
-# Based on a list of 3 events prepared by the previous Agent, creates a creative promotional menu for the café (coffee/cake) and an advertising post on Facebook
-marketing_agent = Agent(
-    name="marketing_agent",
-    model=model,
-    description="Expert in creative marketing for coffee shops.",
-    instruction="""
+# Based on one of the 3 events prepared by the previous Agent, creates a creative promotional menu for the café (coffee/cake) and an advertising post on Facebook.
+# The stage fans out into one agent per event, running in parallel - each bundle is a short, independent generation.
+
+# Number of top events selected by impact_agent (one marketing agent each)
+TOP_EVENTS = 3
+
+MARKETING_INSTRUCTION = """
     Jesteś kreatywnym menadżerem kawiarni oraz marketingowcem.
+
+    PROFIL KAWIARNI: {cafe_profile}
     
-    TWÓJ CEL: Twoim zadaniem jest stworzenie menu i posta na podstawie dostarczonego raportu o wydarzeniach w Łodzi: {impact_results}.
+    TWÓJ CEL: Twoim zadaniem jest stworzenie menu i posta dla WYDARZENIA NR {event_number} (pole "id") z dostarczonego raportu o wydarzeniach {city_locative}: {impact_compact}.
     
     INSTRUKCJA:
-    1. Dla każdego wydarzenia, wymyśl nazwę kawy i ciasta nawiązującą do niego oraz podaj z czego są zrobione. Przygotuj dla każdego wydarzenia inny zestaw kawy i ciastka/ciasta.
-    2. Napisz post na Facebooka dla każdego wariantu (zestawu kawa-ciasto).
+    1. Dla tego wydarzenia wymyśl nazwę kawy i ciasta nawiązującą do niego oraz podaj z czego są zrobione.
+    2. Napisz post na Facebooka dla tego zestawu kawa-ciasto.
+    3. Zajmij się TYLKO wydarzeniem nr {event_number}. Jeśli raport nie zawiera wydarzenia o tym numerze, zwróć pustą listę "output".
     
     ZASADY BIZNESOWE (KRYTYCZNE):
     - Twoim celem jest SPRZEDAŻ produktów w kawiarni. Wydarzenie to tylko pretekst (Real Time Marketing).
@@ -168,42 +211,85 @@ marketing_agent = Agent(
     - Styl: Luźny, zapraszający, ale profesjonalny.
 
     UWAGI:
-    1. Przepisz z raportu dokładne: DATĘ, NAZWĘ, LOKALIZACJĘ i OPIS wydarzenia do JSON-a.
-    2. BARDZO WAŻNE: Przepisz z raportu pola "impact_score", "score_breakdown" oraz "comments" BEZ ŻADNYCH ZMIAN. Muszą znaleźć się w twoim wyniku.
+    1. Przepisz z raportu dokładną NAZWĘ wydarzenia (pole "event_name"). Data, miejsce, opis i punktacja zostaną uzupełnione automatycznie - nie przepisuj ich.
 
     WAŻNE:
-    Wygeneruj odpowiedź WYŁĄCZNIE w formacie JSON. Nie dodawaj żadnego tekstu przed ani po.
-    Struktura JSON musi być listą obiektów (jeden obiekt na jedno wydarzenie/zestaw), np.:
-    {
-        "output": [
-            {
-                "event_date": "YYYY-MM-DD",
-                "event_name": "Nazwa wydarzenia",
-                "location": "Dokładne miejsce (np. Manufaktura)", 
-                "description": "Krótki opis wydarzenia z raportu",
-                "facebook_post": "Treść posta...",
-                "menu_items": [
-                    {"name": "...", "desc": "...", "type": "coffee"},
-                    {"name": "...", "desc": "...", "type": "cake"}
-                ],
-                "impact_score": 85,
-                "score_breakdown":{
-                    "frekwencja": 15,
-                    "zasięg": 18,
-                    "zgodność": 20,
-                    "różnorodność": 12,
-                    "optymizm": 8,
-                },
-                "comments": "Krótkie uzasadnienie wyboru wydarzenia"
-            }
-        ]
-    }
-    """,
-    output_key="menu_json"
-)
+    Odpowiedź jest zwracana jako JSON zgodny ze schematem: lista "output" z jednym obiektem (dla wydarzenia nr {event_number}).
+    """
+
+
+def marketing_output_key(event_number):
+    """Session state key of the bundle created for the given event (1-based)."""
+    return f"menu_json_{event_number}"
+
+
+class MarketingAgent(Agent):
+    """Marketing agent whose failure stays inside its own slot of the parallel stage.
+
+    ParallelAgent runs its sub-agents in one asyncio.TaskGroup, so an exception of one of them (a server
+    error after the retries, a response still breaking the schema after the repair) would cancel the
+    bundles still being generated. A failed agent ends without an output instead.
+    """
+
+    async def _run_async_impl(self, ctx):
+        try:
+            async for event in super()._run_async_impl(ctx):
+                yield event
+        except Exception as e:
+            logger.warning("%s failed, its bundle is left out: %s", self.name, e)
+            metrics.fail_agent_span(ctx.invocation_id, self.name)
+
+
+def build_marketing_agent(event_number):
+    """Creates the marketing agent for one event of the impact report.
+
+    A new instance is returned on every call, so a single failed bundle can be regenerated
+    by its own runner, outside of the root agent tree.
+    """
+    return MarketingAgent(
+        name=f"marketing_agent_{event_number}",
+        model=get_model(),
+        description="Expert in creative marketing for coffee shops.",
+        instruction=MARKETING_INSTRUCTION.replace("{event_number}", str(event_number)),
+        output_key=marketing_output_key(event_number),
+        # No tools - the model is constrained to the JSON schema of the bundle
+        output_schema=MarketingOutput,
+        before_model_callback=llm_cache.before_model_callback,
+        # A response breaking the schema would fail the whole parallel stage - it is repaired first
+        after_model_callback=[parsing.repair_callback("output"), llm_cache.after_model_callback],
+    )
+
+
+def build_marketing_stage():
+    """Creates the parallel stage with one marketing agent per top event."""
+    return ParallelAgent(
+        name="marketing_stage",
+        description="Creates the marketing bundles of all top events in parallel.",
+        sub_agents=[build_marketing_agent(event_number) for event_number in range(1, TOP_EVENTS + 1)],
+    )
+
 
 # --- SEQUENTIAL AGENT ---
-root_agent = SequentialAgent(
-    name="crowdbrew_agent",
-    sub_agents=[research_agent, impact_agent, marketing_agent],
-)
+def build_root_agent():
+    """Creates the whole pipeline: research, impact evaluation and the marketing stage."""
+    return SequentialAgent(
+        name="crowdbrew_agent",
+        sub_agents=[build_research_agent(), build_impact_agent(), build_marketing_stage()],
+        # The café profile comes from the session state - sessions without one get the default café
+        before_agent_callback=cafes.default_state_callback,
+    )
+
+
+def get_root_agent():
+    """Returns the shared pipeline agent, building it on first use."""
+    global _root_agent
+    if _root_agent is None:
+        _root_agent = build_root_agent()
+    return _root_agent
+
+
+def __getattr__(name):
+    # root_agent stays a module attribute (adk web and older callers), built on first access
+    if name == "root_agent":
+        return get_root_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
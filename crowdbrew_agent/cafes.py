@@ -0,0 +1,167 @@
+import os
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from . import database
+
+# Café profiles. The research of a city and date is shared by all cafés of that city, while the impact
+# evaluation and the marketing bundles are made per café - the profile reaches the agents through the
+# session state ({city_locative} and {cafe_profile} in the instructions).
+#
+# Profiles are read from cafes.json (or CROWDBREW_CAFES_FILE): a list of objects with the fields of
+# CafeProfile, see cafes.example.json. The default café is used when no profile is chosen.
+#
+# The bundles of the default café are stored in the Events / Menu / Posts tables (history, search), the
+# bundles of the other cafés in CafeBundles - they point to the shared event rows, so an event found for
+# several cafés of a city is stored once (events are told apart by their city).
+
+CAFES_FILE = os.getenv("CROWDBREW_CAFES_FILE", os.path.join(database.BASE_DIR, "cafes.json"))
+
+DEFAULT_CAFE_ID = "default"
+
+
+@dataclass(frozen=True)
+class CafeProfile:
+    """A café the proposals are made for.
+
+    city_locative is the city in the form used by the prompts ("w Łodzi"); cafés of the same city
+    share one research run.
+    """
+    id: str
+    name: str
+    city: str = database.DEFAULT_CITY
+    city_locative: str = "w Łodzi (miasto w centralnej Polsce)"
+    location: str = ""
+    audience: str = ""
+    menu_style: str = ""
+
+    def describe(self):
+        """Profile text put into the instructions of impact_agent and the marketing agents."""
+        lines = [f"Kawiarnia: {self.name}"]
+        if self.location:
+            lines.append(f"Lokalizacja: {self.location}")
+        if self.audience:
+            lines.append(f"Główni goście: {self.audience}")
+        if self.menu_style:
+            lines.append(f"Styl menu: {self.menu_style}")
+        return "; ".join(lines)
+
+    def state(self):
+        """Session state entries read by the agent instructions."""
+        return {"city_locative": self.city_locative, "cafe_profile": self.describe()}
+
+
+DEFAULT_CAFE = CafeProfile(id=DEFAULT_CAFE_ID, name="CrowdBrew", location="Łódź")
+
+
+def load_cafes(path=None):
+    """Returns the configured profiles by ID (the default café is always included)."""
+    path = path or CAFES_FILE
+    cafes = {DEFAULT_CAFE_ID: DEFAULT_CAFE}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            for entry in json.load(file):
+                profile = CafeProfile(**entry)
+                cafes[profile.id] = profile
+    return cafes
+
+
+def get_cafe(cafe_id=None):
+    """Returns the profile of a café (the default one for None). Raises KeyError for an unknown ID."""
+    cafes = load_cafes()
+    cafe_id = cafe_id or DEFAULT_CAFE_ID
+    if cafe_id not in cafes:
+        raise KeyError(f"Unknown café profile: {cafe_id} (known: {', '.join(sorted(cafes))})")
+    return cafes[cafe_id]
+
+
+def select_cafes(cafe_ids):
+    """Returns the profiles of the given IDs ("all" selects every one). Raises KeyError for an unknown ID."""
+    cafes = load_cafes()
+    if "all" in cafe_ids:
+        return list(cafes.values())
+    unknown = [cafe_id for cafe_id in cafe_ids if cafe_id not in cafes]
+    if unknown:
+        raise KeyError(f"Unknown café profiles: {', '.join(unknown)} (known: {', '.join(sorted(cafes))})")
+    return [cafes[cafe_id] for cafe_id in cafe_ids]
+
+
+def default_state_callback(callback_context):
+    """before_agent_callback of the root agent: the default profile for sessions started without one (adk web)."""
+    for key, value in DEFAULT_CAFE.state().items():
+        if callback_context.state.get(key) is None:
+            callback_context.state[key] = value
+    return None
+
+
+# --- STORAGE OF THE OTHER CAFÉS ---
+def create_cafe_tables(cur):
+    """Creates the bundle table of the non-default cafés (one row per café, date and rank)."""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS CafeBundles (
+        cafe_id TEXT,
+        date TEXT,
+        rank INTEGER,
+        event_id INTEGER,
+        bundle TEXT,
+        updated_at TEXT,
+        PRIMARY KEY(cafe_id, date, rank),
+        FOREIGN KEY(event_id) REFERENCES Events(id)
+    )
+    """)
+
+
+def save_cafe_results(cafe_id, items, city=database.DEFAULT_CITY):
+    """Saves the result of a café in a single transaction, replacing its previous bundle of the same dates.
+
+    The events are shared with the other cafés of the same city: a new one is added, but the impact
+    analysis and the rank of an existing one (made for the default café) are kept. Returns the event ids
+    in the order of items (None for an item repeating an event of an earlier item, which is skipped).
+    """
+    with database.get_connection() as conn:
+        cur = conn.cursor()
+        result_dates = sorted({item["event_date"] for item in items})
+        cur.executemany("DELETE FROM CafeBundles WHERE cafe_id = ? AND date = ?",
+                        [(cafe_id, date) for date in result_dates])
+
+        event_ids = []
+        rows = []
+        ranks = {}
+        for item in items:
+            date = item["event_date"]
+            event_id = database._upsert_event(
+                cur,
+                date,
+                item.get("event_name", "Wydarzenie Nieznane"),
+                item.get("location", f"{city} (nieokreślone)"),
+                item.get("description", "Brak opisu"),
+                city=city,
+            )
+            if event_id in event_ids:
+                event_ids.append(None)
+                continue
+            event_ids.append(event_id)
+            rank = ranks[date] = ranks.get(date, -1) + 1
+            bundle = {key: value for key, value in item.items() if key != "db_id"}
+            rows.append((cafe_id, date, rank, event_id, json.dumps(bundle, ensure_ascii=False), database._now_str()))
+        cur.executemany(
+            "INSERT INTO CafeBundles (cafe_id, date, rank, event_id, bundle, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    return event_ids
+
+
+def get_cafe_bundles(cafe_id, date, max_age_hours=None):
+    """Returns the stored bundle of a café for a date (ordered by rank), like database.get_marketing_bundles()."""
+    cur = database.get_connection().cursor()
+    cur.execute(
+        "SELECT event_id, bundle, updated_at FROM CafeBundles WHERE cafe_id = ? AND date = ? ORDER BY rank",
+        (cafe_id, date)
+    )
+    rows = cur.fetchall()
+    if max_age_hours is not None:
+        cutoff = (datetime.now() - timedelta(hours=max_age_hours)).strftime("%Y-%m-%d %H:%M:%S")
+        if any(updated_at < cutoff for _, _, updated_at in rows):
+            return []
+    return [dict(json.loads(bundle), db_id=event_id) for event_id, bundle, _ in rows]
@@ -0,0 +1,67 @@
+import json
+from datetime import datetime, timedelta
+
+from . import database
+from .cafes import DEFAULT_CAFE_ID
+
+# Checkpoints of a pipeline run. The parsed output of every stage (research report, merged impact report,
+# each marketing bundle) is stored as soon as it arrives, keyed by the normalized date and the run ID.
+# A run that failed later is resumed from them: the stored outputs are put into the session state and
+# every agent whose output is already there is skipped (ResumePlugin in plugins.py), so only the failed
+# stage calls the model again. Runs for different cafés (cafes.py) keep their checkpoints apart.
+
+# Checkpoints older than this are not resumed (the research could be out of date)
+CHECKPOINT_MAX_AGE_HOURS = 24
+
+
+def create_checkpoint_table(cur):
+    """Creates the checkpoint table (one row per run and stage)."""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS Checkpoints (
+        run_id TEXT,
+        date TEXT,
+        stage TEXT,
+        value TEXT,
+        created_at TEXT,
+        cafe_id TEXT,
+        PRIMARY KEY(run_id, stage)
+    )
+    """)
+    # Tables created before the café profiles hold the checkpoints of the default café (NULL)
+    database._ensure_columns(cur, "Checkpoints", {"cafe_id": "TEXT"})
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_checkpoints_date ON Checkpoints(date, created_at)")
+
+
+def save_checkpoint(run_id, date, stage, value, cafe_id=DEFAULT_CAFE_ID):
+    """Stores the parsed output of one stage (stage is the session state key of the output)."""
+    with database.get_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO Checkpoints (run_id, date, stage, value, created_at, cafe_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, date, stage, json.dumps(value, ensure_ascii=False), database._now_str(), cafe_id)
+        )
+
+
+def load_checkpoints(date, max_age_hours=CHECKPOINT_MAX_AGE_HOURS, cafe_id=DEFAULT_CAFE_ID):
+    """Returns (run_id, {stage: value}) of the latest unfinished run of the café for the date, or (None, {})."""
+    cutoff = (datetime.now() - timedelta(hours=max_age_hours)).strftime("%Y-%m-%d %H:%M:%S")
+    with database.get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT run_id FROM Checkpoints WHERE date = ? AND created_at >= ? AND COALESCE(cafe_id, ?) = ? "
+            "ORDER BY created_at DESC LIMIT 1",
+            (date, cutoff, DEFAULT_CAFE_ID, cafe_id)
+        )
+        row = cur.fetchone()
+        if not row:
+            return None, {}
+        cur.execute("SELECT stage, value FROM Checkpoints WHERE run_id = ?", (row[0],))
+        return row[0], {stage: json.loads(value) for stage, value in cur.fetchall()}
+
+
+def complete_run(run_id):
+    """Drops the checkpoints of a saved run, together with the expired ones of other runs."""
+    cutoff = (datetime.now() - timedelta(hours=CHECKPOINT_MAX_AGE_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+    with database.get_connection() as conn:
+        conn.execute("DELETE FROM Checkpoints WHERE run_id = ? OR created_at < ?", (run_id, cutoff))
+
@@ -1,7 +1,12 @@
 import sqlite3
 import json
 import os
-from datetime import datetime
+import re
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+from .dates import fold
 
 # Unification of the database saving path
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -12,17 +17,69 @@ if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
 
-def get_connection():
-    """Establishes a connection to the SQLite database."""
-    return sqlite3.connect(DB_NAME)
+# City of the events saved without one (the city of the default café)
+DEFAULT_CITY = "Łódź"
+
+# Connection tuning: WAL lets readers work alongside a writer, busy_timeout makes concurrent
+# writers wait for the lock instead of failing with "database is locked"
+BUSY_TIMEOUT_MS = 10000
+CACHE_SIZE_KB = 16384
+
+# One connection per thread and database file, reused by every call made from that thread
+_local = threading.local()
+
+# Database files already initialized by this process (init_db() runs its migrations once per file)
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection(path=None):
+    """Returns the SQLite connection of the current thread (opened and tuned on first use).
+
+    Use it as a context manager - the block is committed or rolled back, the connection stays open.
+    """
+    path = path or DB_NAME
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = _open_connection(path)
+    return conn
+
+
+async def run_async(func, *args, **kwargs):
+    """Runs a database function in a worker thread so asyncio callers don't block the event loop.
+
+    Every worker thread has its own connection, so concurrent calls never share a transaction.
+    """
+    return await asyncio.to_thread(func, *args, **kwargs)
 
 
 def init_db():
-    """Initializes the database tables if they do not exist."""
+    """Initializes the database tables if they do not exist (once per process and database file)."""
+    with _init_lock:
+        if DB_NAME not in _initialized:
+            _create_tables()
+            _initialized.add(DB_NAME)
+
+
+def _create_tables():
     with get_connection() as conn:
         cur = conn.cursor()
         
-        # 1. Events Table
+        # 1. Events Table (events of the same name in different cities are different events)
+        _migrate_events_city(cur)
         cur.execute("""
         CREATE TABLE IF NOT EXISTS Events (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -30,7 +87,8 @@ def init_db():
             name TEXT,
             location TEXT,
             description TEXT,
-            UNIQUE(date, name)
+            city TEXT,
+            UNIQUE(date, name, city)
         )
         """)
 
@@ -59,60 +117,229 @@ def init_db():
             UNIQUE(event_id, content)
         )
         """)
+        # 4. Columns added after the first release (impact analysis and ordering of a bundle)
+        added = _ensure_columns(cur, "Events", {
+            "impact_score": "INTEGER",
+            "score_breakdown": "TEXT",
+            "comments": "TEXT",
+            "rank": "INTEGER",
+            "updated_at": "TEXT",
+            "name_norm": "TEXT",
+        })
+
+        # 5. Normalized names (deduplication) - backfilled once for databases created before the column
+        if "name_norm" in added:
+            cur.execute("SELECT id, name FROM Events")
+            cur.executemany(
+                "UPDATE Events SET name_norm = ? WHERE id = ?",
+                [(normalize_event_name(name or ""), event_id) for event_id, name in cur.fetchall()]
+            )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_date_name_norm ON Events(date, name_norm)")
+        # Keyset pagination of the history by (date, id) - the index rows are ordered by date and rowid
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_date ON Events(date)")
+
+        # 6. Full-text search index kept in sync by triggers
+        from .search import create_search_tables
+        create_search_tables(cur)
+
+        # 7. Checkpoints of the stage outputs (resuming failed runs)
+        from .checkpoints import create_checkpoint_table
+        create_checkpoint_table(cur)
+
+        # 8. Index of the local event feeds (first source of the research)
+        from .feeds import create_feed_tables
+        create_feed_tables(cur)
+
+        # 9. Bundles of the cafés other than the default one (café profiles)
+        from .cafes import create_cafe_tables
+        create_cafe_tables(cur)
         conn.commit()
 
 
-def add_event(date, name, location, description):
-    """Adds a new event only if a similar one doesn't exist for that date."""
-    
-    def normalize(text):
-        return text.lower().strip().strip('.').strip()
-    
-    normalized_new_name = normalize(name)
+def _migrate_events_city(cur):
+    """Rebuilds an Events table created before the city column, so its unique key can include the city.
 
-    with get_connection() as conn:
-        cur = conn.cursor()
-        
-        #1. Retrieving all events for this specific date
-        cur.execute("SELECT id, name FROM Events WHERE date = ?", (date,))
-        existing_events = cur.fetchall()
-        
-        # 2. Check if a similar event already exists
-        for db_id, db_name in existing_events:
-            normalized_db_name = normalize(db_name)
-
-            if normalized_new_name in normalized_db_name or normalized_db_name in normalized_new_name:
-                print(f"   (i) Duplicate detected: '{name}' fits to '{db_name}' (ID: {db_id})")
-                return db_id
-         
-        # 3. Adding an entry if no duplicates are detected
-        try:
-            print(f"   (+) Adding a new event: '{name}'")
+    The existing events get the default city. The ids are kept, so the menus, posts and the search index
+    still point to them; the triggers and indexes dropped with the old table are created again by
+    _create_tables().
+    """
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'Events'")
+    row = cur.fetchone()
+    if not row or "city" in row[0]:
+        return
+    cur.execute("PRAGMA table_info(Events)")
+    columns = [(column[1], column[2]) for column in cur.fetchall()]
+    cur.execute("""
+    CREATE TABLE Events_migrated (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT,
+        name TEXT,
+        location TEXT,
+        description TEXT,
+        city TEXT,
+        UNIQUE(date, name, city)
+    )
+    """)
+    _ensure_columns(cur, "Events_migrated", dict(columns))
+    column_list = ", ".join(column for column, _ in columns)
+    cur.execute(f"INSERT INTO Events_migrated ({column_list}, city) SELECT {column_list}, ? FROM Events",
+                (DEFAULT_CITY,))
+    cur.execute("DROP TABLE Events")
+    # The search triggers of the menus refer to Events - the legacy rename does not check them
+    cur.execute("PRAGMA legacy_alter_table = ON")
+    cur.execute("ALTER TABLE Events_migrated RENAME TO Events")
+    cur.execute("PRAGMA legacy_alter_table = OFF")
+
+
+def _ensure_columns(cur, table, columns):
+    """Adds missing columns to an existing table (lightweight schema migration). Returns the added ones."""
+    cur.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cur.fetchall()}
+    added = []
+    for column, column_type in columns.items():
+        if column not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            added.append(column)
+    return added
+
+
+def _now_str():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# --- EVENT DEDUPLICATION ---
+# Two names of the same date are duplicates when one's words are contained in the other's,
+# one is the acronym of the other ("36. MFKiG" vs "Międzynarodowy Festiwal Komiksu i Gier")
+# or their character trigrams are similar enough (typos, small wording changes).
+SIMILARITY_THRESHOLD = 0.7
+_STOPWORDS = {"i", "w", "we", "z", "na", "do", "o", "dla", "oraz", "the", "of"}
+
+
+def normalize_event_name(name):
+    """Lowercased, diacritics-folded name without punctuation (stored in Events.name_norm)."""
+    return " ".join(re.sub(r"[^\w\s]|_", " ", fold(name)).split())
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _acronym(tokens):
+    return "".join(token[0] for token in tokens if not token.isdigit())
+
+
+def name_similarity(first_norm, second_norm):
+    """Similarity (0-1) of two normalized event names."""
+    if first_norm == second_norm:
+        return 1.0
+    first_tokens, second_tokens = first_norm.split(), second_norm.split()
+    first_words = {token for token in first_tokens if token not in _STOPWORDS}
+    second_words = {token for token in second_tokens if token not in _STOPWORDS}
+    if not first_words or not second_words:
+        return 0.0
+
+    # 1. Token-set containment ("parkrun" vs "parkrun lodz")
+    if first_words <= second_words or second_words <= first_words:
+        return 1.0
+
+    # 2. Acronyms written in one of the names
+    first_acronym, second_acronym = _acronym(first_tokens), _acronym(second_tokens)
+    if (len(first_acronym) >= 3 and first_acronym in second_words) or \
+            (len(second_acronym) >= 3 and second_acronym in first_words):
+        return 1.0
+
+    # 3. Character trigram Jaccard similarity (different numbers mean different events: "Koncert 1" vs "Koncert 2")
+    first_numbers = {token for token in first_words if token.isdigit()}
+    second_numbers = {token for token in second_words if token.isdigit()}
+    if first_numbers and second_numbers and not first_numbers & second_numbers:
+        return 0.0
+    first_grams, second_grams = _trigrams(first_norm), _trigrams(second_norm)
+    return len(first_grams & second_grams) / len(first_grams | second_grams)
+
+
+def _find_duplicate(cur, date, name, city=DEFAULT_CITY):
+    """Returns (id, name) of a similar event already stored for that date and city, or None."""
+    name_norm = normalize_event_name(name)
+
+    # 1. Exact match of the normalized name (index lookup)
+    cur.execute("SELECT id, name FROM Events WHERE date = ? AND name_norm = ? AND city = ?", (date, name_norm, city))
+    exact = cur.fetchone()
+    if exact:
+        return exact
+
+    # 2. Fuzzy match among the events of that date (index range scan on the date)
+    cur.execute("SELECT id, name, name_norm FROM Events WHERE date = ? AND city = ?", (date, city))
+    best, best_score = None, SIMILARITY_THRESHOLD
+    for db_id, db_name, db_name_norm in cur.fetchall():
+        score = name_similarity(name_norm, db_name_norm or normalize_event_name(db_name))
+        if score >= best_score:
+            best, best_score = (db_id, db_name), score
+    return best
+
+
+def _upsert_event(cur, date, name, location, description,
+                  impact_score=None, score_breakdown=None, comments=None, rank=None, city=DEFAULT_CITY):
+    """Inserts an event or refreshes the impact analysis of its duplicate. Returns the event id."""
+    breakdown_json = json.dumps(score_breakdown, ensure_ascii=False) if score_breakdown is not None else None
+
+    duplicate = _find_duplicate(cur, date, name, city)
+    if duplicate:
+        db_id, db_name = duplicate
+        print(f"   (i) Duplicate detected: '{name}' fits to '{db_name}' (ID: {db_id})")
+        if impact_score is not None or rank is not None:
             cur.execute(
-                'INSERT OR IGNORE INTO Events (date, name, location, description) VALUES (?, ?, ?, ?)',
-                (date, name, location, description)
+                'UPDATE Events SET impact_score = ?, score_breakdown = ?, comments = ?, rank = ?, updated_at = ? WHERE id = ?',
+                (impact_score, breakdown_json, comments, rank, _now_str(), db_id)
             )
-            conn.commit()
-            return cur.lastrowid
-        except sqlite3.IntegrityError:
-            # Fallback in case of perfect duplicate caught by SQL
-            cur.execute('SELECT id FROM Events WHERE date = ? AND name = ?', (date, name))
-            result = cur.fetchone()
-            return result[0] if result else None
+        return db_id
+
+    # 3. Adding an entry if no duplicates are detected
+    print(f"   (+) Adding a new event: '{name}'")
+    cur.execute(
+        'INSERT OR IGNORE INTO Events (date, name, name_norm, location, description, impact_score, score_breakdown, comments, rank, updated_at, city) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (date, name, normalize_event_name(name), location, description, impact_score, breakdown_json, comments, rank, _now_str(), city)
+    )
+    if cur.rowcount:
+        return cur.lastrowid
+    # Fallback in case of perfect duplicate caught by SQL
+    cur.execute('SELECT id FROM Events WHERE date = ? AND name = ? AND city = ?', (date, name, city))
+    result = cur.fetchone()
+    return result[0] if result else None
+
+
+def add_event(date, name, location, description,
+              impact_score=None, score_breakdown=None, comments=None, rank=None, city=DEFAULT_CITY):
+    """Adds a new event only if a similar one doesn't exist for that date and city.
+
+    Impact analysis fields are stored (or refreshed on a duplicate) when provided.
+    """
+    with get_connection() as conn:
+        return _upsert_event(conn.cursor(), date, name, location, description,
+                             impact_score, score_breakdown, comments, rank, city)
+
 
+def add_marketing_bundle(event_id, json_data, replace=False):
+    """Parses JSON output from the agent and saves menu items and posts.
 
-def add_marketing_bundle(event_id, json_data):
-    """Parses JSON output from the agent and saves menu items and posts."""
+    With replace=True a previously generated menu and post of the event are overwritten.
+    """
     if not event_id:
         return
     
     # Checking if this event already has a post/menu assigned
     with get_connection() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT id FROM Posts WHERE event_id = ?", (event_id,))
-        if cur.fetchone():
-            print(f"   🛑 Event ID {event_id} has already generated menu and post. Saving skipped.")
-            return
+        if replace:
+            cur.execute("DELETE FROM Posts WHERE event_id = ?", (event_id,))
+            cur.execute("DELETE FROM Menu WHERE event_id = ?", (event_id,))
+            conn.commit()
+        else:
+            cur.execute("SELECT id FROM Posts WHERE event_id = ?", (event_id,))
+            if cur.fetchone():
+                print(f"   🛑 Event ID {event_id} has already generated menu and post. Saving skipped.")
+                return
 
     if isinstance(json_data, str):
         try:
@@ -149,4 +376,196 @@ def add_marketing_bundle(event_id, json_data):
                     current_date_str
                 )
             )
-        conn.commit()
\ No newline at end of file
+        conn.commit()
+
+
+def save_results(items):
+    """Saves a pipeline result (events, posts and menu items) in a single transaction.
+
+    Each item follows the marketing agent output format with "event_date" set. Events of the same
+    date are ranked in the order of items and replace the previous bundle of that date. If anything
+    fails, the whole result is rolled back. Returns the event ids in the order of items.
+
+    An item naming the same event as an earlier item of the result (a duplicate under another name) is
+    skipped and gets None instead of an id - the first bundle of the event is kept.
+    """
+    current_date_str = datetime.now().strftime("%Y-%m-%d")
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+
+        # 1. Older proposals for the same dates stop being part of the current bundle
+        result_dates = sorted({item["event_date"] for item in items})
+        cur.executemany("UPDATE Events SET rank = NULL WHERE date = ? AND city = ?",
+                        [(date, DEFAULT_CITY) for date in result_dates])
+
+        # 2. Events (one statement each - their ids are needed for the bundle rows)
+        event_ids = []
+        ranks = {}
+        for item in items:
+            date = item["event_date"]
+            name = item.get("event_name", "Wydarzenie Nieznane")
+            duplicate = _find_duplicate(cur, date, name)
+            if duplicate and duplicate[0] in event_ids:
+                print(f"   🛑 '{name}' repeats event ID {duplicate[0]} of this result. Saving skipped.")
+                event_ids.append(None)
+                continue
+            rank = ranks[date] = ranks.get(date, -1) + 1
+            event_ids.append(_upsert_event(
+                cur,
+                date,
+                name,
+                item.get("location", f"{DEFAULT_CITY} (nieokreślone)"),
+                item.get("description", "Brak opisu"),
+                impact_score=item.get("impact_score"),
+                score_breakdown=item.get("score_breakdown"),
+                comments=item.get("comments"),
+                rank=rank,
+            ))
+
+        # 3. Regenerated menus and posts replace the stale ones
+        stale = [(event_id,) for event_id in set(event_ids) if event_id]
+        cur.executemany("DELETE FROM Posts WHERE event_id = ?", stale)
+        cur.executemany("DELETE FROM Menu WHERE event_id = ?", stale)
+
+        posts = []
+        menu_rows = []
+        for event_id, item in zip(event_ids, items):
+            if not event_id:
+                continue
+            if item.get("facebook_post"):
+                posts.append((event_id, item["facebook_post"], current_date_str))
+            for menu_item in item.get("menu_items", []):
+                menu_rows.append((
+                    event_id,
+                    menu_item.get("name", ""),
+                    menu_item.get("desc", ""),
+                    menu_item.get("type", "other"),
+                    current_date_str
+                ))
+        cur.executemany('INSERT OR IGNORE INTO Posts (event_id, content, created_at) VALUES (?, ?, ?)', posts)
+        cur.executemany(
+            'INSERT OR IGNORE INTO Menu (event_id, item_name, item_description, item_type, created_at) VALUES (?, ?, ?, ?, ?)',
+            menu_rows
+        )
+
+    return event_ids
+
+
+def get_marketing_bundles(date, max_age_hours=None):
+    """Returns the stored bundle for a date in the agent output format (ordered by rank).
+
+    Only events ranked in the latest run and having a post are returned. With max_age_hours
+    set, an empty list is returned when the stored bundle is older than that.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT e.id, e.date, e.name, e.location, e.description,
+                   e.impact_score, e.score_breakdown, e.comments, e.updated_at, p.content
+            FROM Events e
+            JOIN Posts p ON p.event_id = e.id
+            WHERE e.date = ? AND e.rank IS NOT NULL
+            ORDER BY e.rank
+        """, (date,))
+        rows = cur.fetchall()
+        if not rows:
+            return []
+
+        if max_age_hours is not None:
+            cutoff = (datetime.now() - timedelta(hours=max_age_hours)).strftime("%Y-%m-%d %H:%M:%S")
+            if any((row[8] or "") < cutoff for row in rows):
+                return []
+
+        bundles = []
+        for event_id, event_date, name, location, description, score, breakdown, comments, _, post in rows:
+            cur.execute(
+                "SELECT item_name, item_description, item_type FROM Menu WHERE event_id = ? ORDER BY id",
+                (event_id,)
+            )
+            menu_items = [{"name": n, "desc": d, "type": t} for n, d, t in cur.fetchall()]
+            bundles.append({
+                "event_date": event_date,
+                "event_name": name,
+                "location": location,
+                "description": description,
+                "facebook_post": post,
+                "menu_items": menu_items,
+                "impact_score": score or 0,
+                "score_breakdown": json.loads(breakdown) if breakdown else {},
+                "comments": comments or "",
+                "db_id": event_id,
+            })
+        return bundles
+
+
+# --- HISTORY (web app dashboard) ---
+def history_version():
+    """Changes whenever a result is saved (every save writes new posts), so cached reads can be keyed by it."""
+    with get_connection() as conn:
+        return conn.execute("SELECT MAX(id) FROM Posts").fetchone()[0] or 0
+
+
+def get_history_page(after=None, limit=20, min_score=None, item_type=None):
+    """Returns one page of the generated proposals, newest date first (keyset pagination).
+
+    after is the (event_date, db_id) of the last item of the previous page. Only events with a post
+    are listed, optionally with an impact score of at least min_score or a menu item of item_type.
+    The post bodies are not read - see get_post().
+    """
+    conditions = ["EXISTS (SELECT 1 FROM Posts p WHERE p.event_id = e.id)"]
+    params = []
+    if after:
+        conditions.append("(e.date, e.id) < (?, ?)")
+        params.extend(after)
+    if min_score:
+        conditions.append("e.impact_score >= ?")
+        params.append(min_score)
+    if item_type:
+        conditions.append("EXISTS (SELECT 1 FROM Menu m WHERE m.event_id = e.id AND m.item_type = ?)")
+        params.append(item_type)
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT e.id, e.date, e.name, e.location, e.description, e.impact_score, e.score_breakdown, e.comments
+            FROM Events e
+            WHERE {" AND ".join(conditions)}
+            ORDER BY e.date DESC, e.id DESC
+            LIMIT ?
+        """, (*params, limit))
+        rows = cur.fetchall()
+
+        # Menu items of the whole page in one query
+        menus = {}
+        if rows:
+            cur.execute(
+                f"SELECT event_id, item_name, item_description, item_type FROM Menu "
+                f"WHERE event_id IN ({', '.join('?' * len(rows))}) ORDER BY id",
+                [row[0] for row in rows]
+            )
+            for event_id, name, desc, item_kind in cur.fetchall():
+                menus.setdefault(event_id, []).append({"name": name, "desc": desc, "type": item_kind})
+
+    return [
+        {
+            "event_date": event_date,
+            "event_name": name,
+            "location": location,
+            "description": description,
+            "menu_items": menus.get(event_id, []),
+            "impact_score": score or 0,
+            "score_breakdown": json.loads(breakdown) if breakdown else {},
+            "comments": comments or "",
+            "db_id": event_id,
+        }
+        for event_id, event_date, name, location, description, score, breakdown, comments in rows
+    ]
+
+
+def get_post(event_id):
+    """Returns the post generated for an event ("" when there is none)."""
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT content FROM Posts WHERE event_id = ? ORDER BY id DESC LIMIT 1", (event_id,)).fetchone()
+    return row[0] if row else ""
@@ -0,0 +1,189 @@
+import re
+import unicodedata
+from datetime import date, timedelta
+
+# Deterministic normalizer of Polish date queries ("27 września 2025", "jutro", "w najbliższą sobotę",
+# "27-28 września", "2025-09-27") - resolves the date locally instead of asking the research agent.
+
+# Longest ranges expanded from a single query (protects the batch mode from typos like "1-31 grudnia 2025-2026")
+MAX_RANGE_DAYS = 31
+
+# Month names in all grammatical cases, matched on lowercase text without Polish diacritics
+MONTHS = {
+    1: r"stycz(?:en|nia|niu|niem)",
+    2: r"lut(?:y|ego|ym|emu)",
+    3: r"mar(?:zec|ca|cu|cem|cowi)",
+    4: r"kwie(?:cien|tnia|tniu|tniem|tniowi)",
+    5: r"maj(?:a|u|em|owi)?",
+    6: r"czerw(?:iec|ca|cu|cem|cowi)",
+    7: r"lip(?:iec|ca|cu|cem|cowi)",
+    8: r"sierp(?:ien|nia|niu|niem|niowi)",
+    9: r"wrze(?:sien|snia|sniu|sniem|sniowi)",
+    10: r"pazdziernik(?:a|u|iem|owi)?",
+    11: r"listopad(?:a|zie|em|owi)?",
+    12: r"grud(?:zien|nia|niu|niem|niowi)",
+}
+
+# Weekday stems (Monday = 0) covering nominative, accusative and locative forms
+WEEKDAYS = {
+    0: r"poniedzial(?:ek|ku)",
+    1: r"wtor(?:ek|ku)",
+    2: r"srod(?:a|e|zie)",
+    3: r"czwart(?:ek|ku)",
+    4: r"piat(?:ek|ku)",
+    5: r"sobot(?:a|e|y|cie)",
+    6: r"niedziel(?:a|e|i)",
+}
+
+_MONTH_PATTERN = "|".join(f"(?P<m{number}>{pattern})" for number, pattern in MONTHS.items())
+_WEEKDAY_PATTERN = "|".join(f"(?P<w{number}>{pattern})" for number, pattern in WEEKDAYS.items())
+_RANGE_SEPARATOR = r"\s*(?:-|–|—|do|\.\.\.?)\s*"
+
+_ISO_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_NUMERIC_RE = re.compile(r"\b(\d{1,2})[./](\d{1,2})(?:[./](\d{4}))?\b")
+_TEXTUAL_RE = re.compile(
+    rf"\b(?:od\s+)?(\d{{1,2}})(?:{_RANGE_SEPARATOR}(\d{{1,2}}))?\.?\s+(?:{_MONTH_PATTERN})\b(?:\s+(\d{{4}}))?"
+)
+_WEEKDAY_RE = re.compile(
+    rf"\b(?:(?P<next>przyszl\w*|nastepn\w*)\s+|(?:najblizsz\w*|ten|ta|te|tym|tej)\s+)?(?:{_WEEKDAY_PATTERN})\b"
+)
+_RELATIVE_DAYS = [
+    (re.compile(r"\bpojutrze\b"), 2),
+    (re.compile(r"\bjutro\b"), 1),
+    (re.compile(r"\b(?:dzis|dzisiaj)\b"), 0),
+]
+_IN_DAYS_RE = re.compile(r"\bza\s+(\d{1,2})\s+dn(?:i|ia)\b")
+_WEEKEND_RE = re.compile(r"\bweekend\w*\b")
+
+
+def fold(text):
+    """Lowercases the text and strips Polish diacritics (ł -> l, ś -> s, ...)."""
+    text = text.lower().replace("ł", "l")
+    return "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char))
+
+
+def _safe_date(year, month, day):
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def _with_default_year(month, day, year, today):
+    """Dates without a year point to the nearest upcoming occurrence."""
+    if year:
+        return _safe_date(year, month, day)
+    candidate = _safe_date(today.year, month, day)
+    if candidate and candidate < today:
+        candidate = _safe_date(today.year + 1, month, day)
+    return candidate
+
+
+def _matched_group(match, prefix, mapping):
+    for number in mapping:
+        if match.group(f"{prefix}{number}"):
+            return number
+    return None
+
+
+def _span(start, end):
+    if not start or not end or end < start or (end - start).days >= MAX_RANGE_DAYS:
+        return [start] if start else []
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def _find_absolute(text, today):
+    """Returns (position, end, [dates]) for every absolute date mention in the folded text."""
+    mentions = []
+
+    for match in _ISO_RE.finditer(text):
+        found = _safe_date(*match.groups())
+        if found:
+            mentions.append((match.start(), match.end(), [found]))
+
+    for match in _NUMERIC_RE.finditer(text):
+        if any(start <= match.start() < end for start, end, _ in mentions):
+            continue
+        day, month, year = match.groups()
+        found = _with_default_year(month, day, year, today)
+        if found:
+            mentions.append((match.start(), match.end(), [found]))
+
+    for match in _TEXTUAL_RE.finditer(text):
+        first_day, last_day, year = match.group(1), match.group(2), match.groups()[-1]
+        month = _matched_group(match, "m", MONTHS)
+        start = _with_default_year(month, first_day, year, today)
+        end = _with_default_year(month, last_day, year, today) if last_day else None
+        if start and end and end < start and not year:
+            # "30-2 stycznia" style ranges crossing the year boundary are not supported - keep the first day
+            end = None
+        mentions.append((match.start(), match.end(), _span(start, end) if end else [start] if start else []))
+
+    mentions = sorted(mention for mention in mentions if mention[2])
+
+    # Merge "30 września - 2 października" style ranges spanning two mentions
+    merged = []
+    for mention in mentions:
+        if merged:
+            previous = merged[-1]
+            between = text[previous[1]:mention[0]]
+            if re.fullmatch(_RANGE_SEPARATOR, between) and len(previous[2]) == 1 and len(mention[2]) == 1:
+                merged[-1] = (previous[0], mention[1], _span(previous[2][0], mention[2][0]))
+                continue
+        merged.append(mention)
+    return merged
+
+
+def _find_relative(text, today):
+    for pattern, offset in _RELATIVE_DAYS:
+        if pattern.search(text):
+            return [today + timedelta(days=offset)]
+
+    match = _IN_DAYS_RE.search(text)
+    if match:
+        return [today + timedelta(days=int(match.group(1)))]
+
+    match = _WEEKDAY_RE.search(text)
+    if match:
+        weekday = _matched_group(match, "w", WEEKDAYS)
+        if match.group("next"):
+            # "w przyszłą sobotę" - the given day of the next calendar week
+            next_monday = today + timedelta(days=7 - today.weekday())
+            return [next_monday + timedelta(days=weekday)]
+        return [today + timedelta(days=(weekday - today.weekday()) % 7)]
+
+    if _WEEKEND_RE.search(text):
+        if today.weekday() == 6:
+            return [today]
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+        return [saturday, saturday + timedelta(days=1)]
+
+    return []
+
+
+def parse_dates(query, today=None):
+    """Returns the list of dates (datetime.date) described by a Polish query, or [] if none was found.
+
+    A single date gives a one-element list, ranges and weekends are expanded day by day.
+    """
+    today = today or date.today()
+    text = fold(query or "")
+
+    mentions = _find_absolute(text, today)
+    if mentions:
+        found = []
+        for _, _, mention_dates in mentions:
+            found.extend(day for day in mention_dates if day not in found)
+        return found
+    return _find_relative(text, today)
+
+
+def normalize_dates(query, today=None):
+    """Returns all dates of a query as YYYY-MM-DD strings."""
+    return [day.strftime("%Y-%m-%d") for day in parse_dates(query, today)]
+
+
+def normalize_date(query, today=None):
+    """Returns the first date of a query as YYYY-MM-DD, or None when the query has no recognizable date."""
+    found = parse_dates(query, today)
+    return found[0].strftime("%Y-%m-%d") if found else None
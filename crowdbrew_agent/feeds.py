@@ -0,0 +1,295 @@
+import os
+import re
+import csv
+import json
+import time
+import logging
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from . import database
+from .dates import normalize_date
+
+# Local event feeds (venue calendars exported as ICS, CSV or JSON files) indexed by date. The research step
+# reads this index first: with enough known events for a date the google_search call is skipped, otherwise
+# the known events are passed to research_agent, which only searches for the missing ones.
+#
+# Supported files in FEEDS_DIR:
+#   *.ics  - VEVENT entries (SUMMARY, DTSTART, DTEND, LOCATION, DESCRIPTION)
+#   *.csv  - header with date (or event_date), name (or event_name), location, description, optional end_date
+#   *.json - list of events with the same fields (or {"events": [...]} / {"research_summary": [...]})
+
+logger = logging.getLogger(__name__)
+
+FEEDS_DIR = os.getenv("CROWDBREW_FEEDS_DIR", os.path.join(database.DATA_DIR, "feeds"))
+
+# Known events needed to skip the live search for a date
+MIN_FEED_EVENTS = 6
+
+# Multi-day entries are indexed on every day, up to this many days
+MAX_EVENT_DAYS = 31
+
+# How often the pipeline looks for new or changed feed files
+INGEST_INTERVAL_SECONDS = 300
+
+TIMEZONE = ZoneInfo("Europe/Warsaw")
+
+# Accepted column / field names (Polish headers included)
+_FIELDS = {
+    "event_date": ("event_date", "date", "data", "start", "start_date"),
+    "end_date": ("end_date", "end", "data_konca"),
+    "event_name": ("event_name", "name", "nazwa", "title", "tytul", "tytuł"),
+    "location": ("location", "place", "miejsce", "venue"),
+    "description": ("description", "desc", "opis"),
+}
+
+_last_ingest = 0.0
+
+
+def create_feed_tables(cur):
+    """Creates the feed event index and the list of ingested files."""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS FeedEvents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT,
+        name TEXT,
+        name_norm TEXT,
+        location TEXT,
+        description TEXT,
+        source TEXT,
+        UNIQUE(date, name_norm)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_feed_events_source ON FeedEvents(source)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS FeedFiles (
+        path TEXT PRIMARY KEY,
+        mtime REAL,
+        size INTEGER,
+        events INTEGER,
+        ingested_at TEXT
+    )
+    """)
+
+
+# --- PARSERS ---
+def _unescape_ics(value):
+    return (value.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",")
+            .replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def _ics_moment(value, params):
+    """Local datetime of an ICS DTSTART/DTEND value (None for a whole-day value) and its date."""
+    value = value.strip()
+    if len(value) == 8 or "VALUE=DATE" in params.upper():
+        return None, datetime.strptime(value[:8], "%Y%m%d").date()
+    moment = datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        moment = moment.replace(tzinfo=timezone.utc).astimezone(TIMEZONE)
+    return moment, moment.date()
+
+
+def parse_ics(text):
+    """Reads the VEVENT entries of an iCalendar file as event dicts (end_date inclusive)."""
+    # Long lines are folded: a continuation line starts with a space or a tab
+    lines = []
+    for line in text.splitlines():
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        else:
+            lines.append(line)
+
+    events, current = [], None
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            current = {}
+        elif line == "END:VEVENT" and current is not None:
+            if current.get("event_name") and current.get("event_date"):
+                events.append(current)
+            current = None
+        elif current is not None and ":" in line:
+            head, value = line.split(":", 1)
+            name, _, params = head.partition(";")
+            name = name.upper()
+            if name == "SUMMARY":
+                current["event_name"] = _unescape_ics(value)
+            elif name == "LOCATION":
+                current["location"] = _unescape_ics(value)
+            elif name == "DESCRIPTION":
+                current["description"] = _unescape_ics(value)
+            elif name in ("DTSTART", "DTEND"):
+                try:
+                    moment, day = _ics_moment(value, params)
+                except ValueError:
+                    continue
+                if name == "DTSTART":
+                    current["event_date"] = day.isoformat()
+                else:
+                    # DTEND is exclusive: a whole-day event or one ending at midnight does not take that day
+                    if moment is None or (moment.hour, moment.minute, moment.second) == (0, 0, 0):
+                        day -= timedelta(days=1)
+                    current["end_date"] = day.isoformat()
+    return events
+
+
+def _pick(row, field):
+    lowered = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+    for alias in _FIELDS[field]:
+        value = lowered.get(alias)
+        if value not in (None, ""):
+            return str(value).strip()
+    return ""
+
+
+def _from_rows(rows):
+    events = []
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        event = {field: _pick(row, field) for field in _FIELDS}
+        if event["event_name"] and event["event_date"]:
+            events.append(event)
+    return events
+
+
+def parse_csv(text):
+    """Reads the rows of a CSV file with a header (comma or semicolon separated)."""
+    dialect = csv.Sniffer().sniff(text[:2048], delimiters=",;\t") if text.strip() else csv.excel
+    return _from_rows(csv.DictReader(text.splitlines(), dialect=dialect))
+
+
+def parse_json(text):
+    """Reads a JSON list of events (or an object holding it under "events" / "research_summary")."""
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("events") or data.get("research_summary") or []
+    return _from_rows(data if isinstance(data, list) else [])
+
+
+PARSERS = {".ics": parse_ics, ".csv": parse_csv, ".json": parse_json}
+
+
+_DOTTED_RE = re.compile(r"^\s*(\d{1,2})[./](\d{1,2})[./](\d{4})\b")
+
+
+def _parse_day(value):
+    """YYYY-MM-DD of a feed date (None when it cannot be read).
+
+    Exports mostly hold ISO dates, often with a time ("2025-09-27T19:00:00"), or dotted numeric ones
+    ("27.09.2025 19:00"); the Polish free-text normalizer is the last resort.
+    """
+    value = (value or "").strip()
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        pass
+    dotted = _DOTTED_RE.match(value)
+    if dotted:
+        day, month, year = (int(part) for part in dotted.groups())
+        try:
+            return date(year, month, day).isoformat()
+        except ValueError:
+            return None
+    return normalize_date(value) if value else None
+
+
+def _days(event):
+    """Every YYYY-MM-DD the event takes place on (capped at MAX_EVENT_DAYS)."""
+    start = _parse_day(event["event_date"])
+    if not start:
+        return []
+    end = _parse_day(event.get("end_date")) or start
+    first = datetime.strptime(start, "%Y-%m-%d")
+    last = max(first, min(datetime.strptime(end, "%Y-%m-%d"), first + timedelta(days=MAX_EVENT_DAYS - 1)))
+    return [(first + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range((last - first).days + 1)]
+
+
+# --- INGESTION ---
+def ingest_file(path):
+    """Replaces the indexed events of one feed file. Returns the number of indexed (date, event) rows."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8-sig") as file:
+        events = PARSERS[extension](file.read())
+
+    rows = []
+    unreadable = []
+    for event in events:
+        days = _days(event)
+        if not days:
+            unreadable.append(f"{event['event_name']} ({event['event_date']})")
+        rows.extend(
+            (day, event["event_name"], database.normalize_event_name(event["event_name"]),
+             event.get("location", ""), event.get("description", ""), path)
+            for day in days
+        )
+    if unreadable:
+        logger.warning("Feed %s: %d events skipped, unreadable date: %s", path, len(unreadable), "; ".join(unreadable))
+    stat = os.stat(path)
+    with database.get_connection() as conn:
+        conn.execute("DELETE FROM FeedEvents WHERE source = ?", (path,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO FeedEvents (date, name, name_norm, location, description, source) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO FeedFiles (path, mtime, size, events, ingested_at) VALUES (?, ?, ?, ?, ?)",
+            (path, stat.st_mtime, stat.st_size, len(rows), database._now_str())
+        )
+    return len(rows)
+
+
+def ingest_feeds(directory=None):
+    """Indexes the new and changed feed files of the directory and forgets the removed ones.
+
+    Returns {path: indexed rows} of the files read in this call (unchanged files are skipped).
+    """
+    global _last_ingest
+    _last_ingest = time.time()
+    directory = os.path.abspath(directory or FEEDS_DIR)
+    paths = []
+    if os.path.isdir(directory):
+        paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if os.path.splitext(name)[1].lower() in PARSERS
+        )
+
+    cur = database.get_connection().cursor()
+    cur.execute("SELECT path, mtime, size FROM FeedFiles")
+    known = {path: (mtime, size) for path, mtime, size in cur.fetchall()}
+
+    ingested = {}
+    for path in paths:
+        stat = os.stat(path)
+        if known.get(path) == (stat.st_mtime, stat.st_size):
+            continue
+        try:
+            ingested[path] = ingest_file(path)
+        except (ValueError, KeyError, csv.Error, UnicodeDecodeError) as e:
+            logger.warning("Feed %s skipped: %s", path, e)
+
+    removed = [path for path in known if path.startswith(directory) and path not in paths]
+    if removed:
+        with database.get_connection() as conn:
+            conn.executemany("DELETE FROM FeedEvents WHERE source = ?", [(path,) for path in removed])
+            conn.executemany("DELETE FROM FeedFiles WHERE path = ?", [(path,) for path in removed])
+    return ingested
+
+
+def refresh_feeds():
+    """Runs ingest_feeds() when the feed directory was not checked for INGEST_INTERVAL_SECONDS."""
+    if time.time() - _last_ingest > INGEST_INTERVAL_SECONDS:
+        ingest_feeds()
+
+
+def events_for_date(date):
+    """Known events of a date in the research result format."""
+    cur = database.get_connection().cursor()
+    cur.execute(
+        "SELECT date, name, location, description FROM FeedEvents WHERE date = ? ORDER BY id",
+        (date,)
+    )
+    return [
+        {"event_date": event_date, "event_name": name, "location": location or "", "description": description or ""}
+        for event_date, name, location, description in cur.fetchall()
+    ]
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import contextvars
+from collections import OrderedDict
+
+from . import database, metrics, parsing
+from .database import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB_NAME = os.path.join(DATA_DIR, 'llm_cache.db')
+
+# Cache modes (env: CROWDBREW_LLM_CACHE):
+#   readwrite - serve hits, record misses (default)
+#   record    - always call the model and overwrite the stored response
+#   replay    - strict replay, a miss raises CacheMissError instead of calling the model
+#   off       - cache disabled
+CACHE_MODE = os.getenv("CROWDBREW_LLM_CACHE", "readwrite").lower()
+
+# Size limit of the cache file content - least recently used responses are evicted first
+MAX_CACHE_BYTES = int(os.getenv("CROWDBREW_LLM_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+
+# Time-to-live per agent: event research goes stale faster than marketing copy
+AGENT_TTL_HOURS = {
+    "research_agent": 12,
+    "impact_agent": 48,
+    "marketing_agent": 24 * 14,
+}
+DEFAULT_TTL_HOURS = 24
+
+# Config fields which do not change the generated content
+_IGNORED_CONFIG_FIELDS = {"http_options", "labels"}
+
+# Set by main.stream_request for a forced refresh: the model is called again and its response replaces
+# the recorded one (record mode for the calls of that request only)
+REFRESH = contextvars.ContextVar("crowdbrew_cache_refresh", default=False)
+
+# Keys computed before a model call, waiting for the response to be recorded. A key is removed when its
+# response is recorded or served from the cache; the keys of failed calls are dropped oldest first.
+_pending_keys = OrderedDict()
+MAX_PENDING_KEYS = 1000
+
+
+class CacheMissError(RuntimeError):
+    """Raised in strict replay mode when no recorded response matches the request."""
+
+
+# Cache files with the Responses table already created
+_initialized_paths = set()
+
+
+def _get_connection():
+    conn = database.get_connection(CACHE_DB_NAME)
+    if CACHE_DB_NAME not in _initialized_paths:
+        with conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS Responses (
+                key TEXT PRIMARY KEY,
+                agent TEXT,
+                response TEXT,
+                size INTEGER,
+                created_at REAL,
+                last_access REAL
+            )
+            """)
+        _initialized_paths.add(CACHE_DB_NAME)
+    return conn
+
+
+def _ttl_seconds(agent_name):
+    for prefix, hours in AGENT_TTL_HOURS.items():
+        if agent_name.startswith(prefix):
+            return hours * 3600
+    return DEFAULT_TTL_HOURS * 3600
+
+
+def request_key(llm_request):
+    """Content address of a model call: model name, instruction, inputs and tool config."""
+    config = llm_request.config.model_dump(mode="json", exclude_none=True, exclude={"response_schema"}) \
+        if llm_request.config else {}
+    for field in _IGNORED_CONFIG_FIELDS:
+        config.pop(field, None)
+    if llm_request.config and isinstance(llm_request.config.response_schema, type):
+        # A pydantic class given as output_schema is keyed by its JSON schema
+        config["response_schema"] = llm_request.config.response_schema.model_json_schema()
+    payload = {
+        "model": llm_request.model,
+        "contents": [content.model_dump(mode="json", exclude_none=True) for content in llm_request.contents],
+        "config": config,
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def lookup(key, agent_name):
+    """Returns the stored response for a key or None when it is missing or expired."""
+    now = time.time()
+    with _get_connection() as conn:
+        row = conn.execute("SELECT response, created_at FROM Responses WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        response_json, created_at = row
+        if created_at + _ttl_seconds(agent_name) < now:
+            conn.execute("DELETE FROM Responses WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE Responses SET last_access = ? WHERE key = ?", (now, key))
+    # Imported on use - the pipeline module imports this one without loading google.adk
+    from google.adk.models import LlmResponse
+    return LlmResponse.model_validate_json(response_json)
+
+
+def store(key, agent_name, llm_response):
+    """Saves a response and evicts the least recently used entries above the size limit."""
+    response_json = llm_response.model_dump_json(exclude_none=True)
+    size = len(response_json.encode("utf-8"))
+    now = time.time()
+    with _get_connection() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO Responses (key, agent, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)',
+            (key, agent_name, response_json, size, now, now)
+        )
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM Responses").fetchone()[0]
+        if total > MAX_CACHE_BYTES:
+            cur = conn.execute("SELECT key, size FROM Responses ORDER BY last_access")
+            evicted = []
+            for old_key, old_size in cur.fetchall():
+                if total <= MAX_CACHE_BYTES:
+                    break
+                evicted.append((old_key,))
+                total -= old_size
+            conn.executemany("DELETE FROM Responses WHERE key = ?", evicted)
+
+
+def clear():
+    """Removes all recorded responses."""
+    with _get_connection() as conn:
+        conn.execute("DELETE FROM Responses")
+
+
+# --- ADK CALLBACKS ---
+def before_model_callback(callback_context, llm_request):
+    """Serves a recorded response instead of calling the model (returns None on a miss)."""
+    if CACHE_MODE == "off":
+        return None
+
+    agent_name = callback_context.agent_name
+    key = request_key(llm_request)
+    pending = (callback_context.invocation_id, agent_name)
+    _pending_keys[pending] = key
+    while len(_pending_keys) > MAX_PENDING_KEYS:
+        _pending_keys.popitem(last=False)
+
+    if CACHE_MODE == "record" or (REFRESH.get() and CACHE_MODE == "readwrite"):
+        return None
+
+    cached = lookup(key, agent_name)
+    if cached:
+        # The after-model callbacks are skipped on a hit, so nothing would remove the key
+        _pending_keys.pop(pending, None)
+        logger.info("LLM cache hit for %s (%s)", agent_name, key[:12])
+        metrics.count("cache_hits")
+        return cached
+    if CACHE_MODE == "replay":
+        _pending_keys.pop(pending, None)
+        raise CacheMissError(f"No recorded response for {agent_name} (key {key[:12]}) in replay mode.")
+    return None
+
+
+def after_model_callback(callback_context, llm_response):
+    """Records a complete, successful model response under the key of its request.
+
+    Responses the repair callback could not bring to the schema are not recorded - a cache hit skips the
+    after-model callbacks, so the broken response would be served until it expires.
+    """
+    key = _pending_keys.pop((callback_context.invocation_id, callback_context.agent_name), None)
+    if not key or CACHE_MODE in ("off", "replay"):
+        return None
+    if llm_response.partial or llm_response.error_code or not llm_response.content:
+        return None
+    if parsing.SCHEMA_ERROR_KEY in (llm_response.custom_metadata or {}):
+        logger.warning("Not caching the response of %s: %s", callback_context.agent_name,
+                       llm_response.custom_metadata[parsing.SCHEMA_ERROR_KEY])
+        return None
+    store(key, callback_context.agent_name, llm_response)
+    return None
@@ -0,0 +1,165 @@
+import os
+import re
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+from . import metrics
+
+# Logging of the agent traces without blocking the event loop. Log calls only put the record into a
+# bounded in-memory queue; a listener thread writes them to a file rotated by size and at midnight, and
+# kept between restarts. Every line carries the ID of the pipeline run it belongs to (metrics.start_run),
+# so the traces of concurrent requests can be told apart. When the writer falls behind, DEBUG records
+# are dropped first, and a warning with the number of dropped records is written once there is room.
+
+LOG_DIR = "evaluation_logs"
+TRACE_FILE = os.path.join(LOG_DIR, "agent_trace.log")
+
+# Level of the trace (DEBUG adds full prompts and responses)
+LOG_LEVEL = os.getenv("CROWDBREW_LOG_LEVEL", "INFO").upper()
+
+# Rotation: a new file at midnight or when the current one reaches the size limit
+MAX_FILE_BYTES = int(os.getenv("CROWDBREW_LOG_MAX_BYTES", 10 * 1024 * 1024))
+ROTATE_WHEN = "midnight"
+BACKUP_COUNT = 14
+
+# Records waiting for the writer. Above DEBUG_HIGH_WATER the DEBUG records are dropped, on a full queue
+# all of them are.
+QUEUE_SIZE = 10_000
+DEBUG_HIGH_WATER = QUEUE_SIZE // 2
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(run_id)s] %(message)s"
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class RunContextFilter(logging.Filter):
+    """Tags a record with the run ID of the context it was logged from ("-" outside of a run)."""
+
+    def filter(self, record):
+        run = metrics.CURRENT_RUN.get()
+        record.run_id = run["run_id"] if run else "-"
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler which never waits for the writer: records which do not fit are dropped and counted."""
+
+    def __init__(self, size=QUEUE_SIZE, debug_high_water=DEBUG_HIGH_WATER):
+        super().__init__(queue.Queue(maxsize=size))
+        self.debug_high_water = debug_high_water
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def emit(self, record):
+        # Checked before the record is formatted, so a dropped DEBUG record costs almost nothing
+        if record.levelno <= logging.DEBUG and self.queue.qsize() >= self.debug_high_water:
+            self._drop()
+            return
+        super().emit(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop()
+            return
+        # The notice waits until the writer has caught up, so a busy period is reported in a few lines
+        if self.dropped and self.queue.qsize() < self.debug_high_water // 2:
+            self._report_drops()
+
+    def _drop(self):
+        with self._dropped_lock:
+            self.dropped += 1
+
+    def _report_drops(self):
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        notice = logging.makeLogRecord({
+            "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING", "run_id": "-",
+            "msg": f"{dropped} log records dropped (the trace writer fell behind)",
+        })
+        try:
+            self.queue.put_nowait(notice)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += dropped
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """TimedRotatingFileHandler which also rotates when the file reaches max_bytes.
+
+    Rotated files are named after the moment of the rotation (agent_trace.log.2025-09-27_03-00-00).
+    """
+
+    def __init__(self, filename, max_bytes=MAX_FILE_BYTES, when=ROTATE_WHEN, backup_count=BACKUP_COUNT):
+        super().__init__(filename, when=when, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.max_bytes = max_bytes
+        self.suffix = "%Y-%m-%d_%H-%M-%S"
+        self.extMatch = re.compile(r"^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(\.\d+)?$", re.ASCII)
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        stamp = time.strftime(self.suffix)
+        rotated, number = f"{self.baseFilename}.{stamp}", 1
+        while os.path.exists(rotated):
+            rotated, number = f"{self.baseFilename}.{stamp}.{number}", number + 1
+        if os.path.exists(self.baseFilename):
+            self.rotate(self.baseFilename, rotated)
+        for old_file in self.getFilesToDelete():
+            os.remove(old_file)
+        self.rolloverAt = self.computeRollover(int(time.time()))
+
+    def getFilesToDelete(self):
+        directory, base_name = os.path.split(self.baseFilename)
+        prefix = base_name + "."
+        rotated = []
+        for name in os.listdir(directory):
+            match = self.extMatch.match(name[len(prefix):]) if name.startswith(prefix) else None
+            if match:
+                # Oldest first: by the stamp, then by the number of a rotation within the same second
+                rotated.append((name[len(prefix):len(prefix) + 19], int((match.group(1) or ".0")[1:]), name))
+        rotated.sort()
+        return [os.path.join(directory, name) for _, _, name in rotated[:max(0, len(rotated) - self.backupCount)]]
+
+
+def queued(handler, size=QUEUE_SIZE):
+    """Returns a BoundedQueueHandler feeding the handler from a listener thread (stopped at exit)."""
+    queue_handler = BoundedQueueHandler(size, min(DEBUG_HIGH_WATER, size // 2))
+    queue_handler.addFilter(RunContextFilter())
+    listener = QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return queue_handler, listener
+
+
+def setup_logging(path=TRACE_FILE, level=LOG_LEVEL):
+    """Sends the records of every logger to the rotating trace file through the queue (once per process)."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        file_handler = SizedTimedRotatingFileHandler(path)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT, defaults={"run_id": "-"}))
+        queue_handler, _listener = queued(file_handler)
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+        return _listener
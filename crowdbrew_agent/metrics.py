@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# Per-run instrumentation: one span per agent (research, impact, every marketing slot, the parallel stage
+# and the whole pipeline) and per database write, with wall time, prompt/completion tokens,
+# google_search queries, retries, repairs and LLM cache hits. Spans are appended to a rotating JSONL file
+# and kept in memory for summary() (p50/p95 per stage). The agent spans are opened and closed by the
+# runner plugin in plugins.py. The file is written from the queue listener thread of logs.py.
+
+LOG_DIR = "evaluation_logs"
+METRICS_FILE = os.path.join(LOG_DIR, "metrics.jsonl")
+MAX_FILE_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# Spans kept in memory for the metrics API
+MAX_SPANS = 5000
+
+COUNTERS = ("prompt_tokens", "completion_tokens", "search_queries", "model_calls", "retries", "repairs",
+            "cache_hits")
+
+# Run being processed in the current context ({"run_id": ..., "date": ...})
+CURRENT_RUN = contextvars.ContextVar("crowdbrew_run", default=None)
+# Key of the open agent span the model calls of the current context belong to
+_current_span = contextvars.ContextVar("crowdbrew_span", default=None)
+
+_spans = deque(maxlen=MAX_SPANS)
+_open_spans = {}
+_lock = threading.Lock()
+_history_loaded = False
+
+_file_logger = logging.getLogger("crowdbrew.metrics")
+_file_logger.propagate = False
+
+
+def _ensure_file_handler():
+    if _file_logger.handlers:
+        return
+    os.makedirs(LOG_DIR, exist_ok=True)
+    handler = RotatingFileHandler(METRICS_FILE, maxBytes=MAX_FILE_BYTES, backupCount=BACKUP_COUNT,
+                                  encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    from .logs import queued
+    queue_handler, _ = queued(handler)
+    _file_logger.addHandler(queue_handler)
+    _file_logger.setLevel(logging.INFO)
+
+
+def _load_history():
+    """Seeds the in-memory spans with the current JSONL file (spans of earlier processes)."""
+    global _history_loaded
+    _history_loaded = True
+    if not os.path.exists(METRICS_FILE):
+        return
+    with open(METRICS_FILE, encoding="utf-8") as file:
+        loaded = []
+        for line in file:
+            try:
+                loaded.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    _spans.extendleft(reversed(loaded[-MAX_SPANS:]))
+
+
+def record_span(span):
+    """Stores a finished span (dict with at least "stage" and "wall_ms")."""
+    run = CURRENT_RUN.get()
+    if run:
+        span = {**run, **span}
+    span.setdefault("ts", time.time())
+    with _lock:
+        if not _history_loaded:
+            _load_history()
+        _spans.append(span)
+        _ensure_file_handler()
+    _file_logger.info(json.dumps(span, ensure_ascii=False))
+
+
+def start_run(run_id, date=None):
+    """Marks the spans recorded in the current context as parts of one pipeline run."""
+    CURRENT_RUN.set({"run_id": run_id, "date": date})
+
+
+@contextmanager
+def span(stage, **fields):
+    """Measures the wall time of a block (e.g. a database write) as a span."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record_span({"stage": stage, "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+                     "status": status, **fields})
+
+
+def _close(open_span, status=None):
+    open_span.pop("run", None)
+    open_span["wall_ms"] = round((time.perf_counter() - open_span.pop("started")) * 1000, 1)
+    if status:
+        open_span["status"] = status
+    record_span(open_span)
+
+
+def end_run():
+    """Closes the agent spans of the current run left open by an error (they are recorded as errors)."""
+    run = CURRENT_RUN.get()
+    with _lock:
+        leftovers = [key for key, open_span in _open_spans.items() if open_span["run"] is run]
+        open_spans = [_open_spans.pop(key) for key in leftovers]
+    for open_span in open_spans:
+        _close(open_span, "error")
+
+
+def count(counter, value=1):
+    """Adds to a counter (retries, repairs, cache_hits, ...) of the agent span of the current context."""
+    key = _current_span.get()
+    with _lock:
+        open_span = _open_spans.get(key)
+        if open_span is not None:
+            open_span[counter] = open_span.get(counter, 0) + value
+
+
+def spans(stage=None, limit=None):
+    """Returns the recorded spans (oldest first), optionally only of one stage."""
+    with _lock:
+        if not _history_loaded:
+            _load_history()
+        selected = [item for item in _spans if stage is None or item.get("stage") == stage]
+    return selected[-limit:] if limit else selected
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summary():
+    """Aggregates the spans per stage: count, p50/p95/max wall time, average tokens and the counter totals."""
+    stages = {}
+    for item in spans():
+        stages.setdefault(item.get("stage", "?"), []).append(item)
+
+    rows = []
+    for stage, stage_spans in stages.items():
+        wall = [item.get("wall_ms", 0) for item in stage_spans]
+        row = {
+            "stage": stage,
+            "count": len(stage_spans),
+            "p50_ms": _percentile(wall, 0.5),
+            "p95_ms": _percentile(wall, 0.95),
+            "max_ms": max(wall),
+            "avg_prompt_tokens": round(sum(item.get("prompt_tokens", 0) for item in stage_spans) / len(stage_spans)),
+            "avg_completion_tokens": round(
+                sum(item.get("completion_tokens", 0) for item in stage_spans) / len(stage_spans)),
+        }
+        for counter in ("search_queries", "retries", "repairs", "cache_hits"):
+            row[counter] = sum(item.get(counter, 0) for item in stage_spans)
+        row["errors"] = sum(1 for item in stage_spans if item.get("status") == "error")
+        rows.append(row)
+    return sorted(rows, key=lambda row: -row["p50_ms"])
+
+
+# --- AGENT SPANS ---
+def open_agent_span(invocation_id, agent_name):
+    """Starts the span of one agent run."""
+    with _lock:
+        _open_spans[(invocation_id, agent_name)] = {
+            "stage": agent_name, "started": time.perf_counter(), "status": "ok",
+            "run": CURRENT_RUN.get(), **dict.fromkeys(COUNTERS, 0)}
+
+
+def close_agent_span(invocation_id, agent_name):
+    """Records the span of a finished agent run."""
+    with _lock:
+        open_span = _open_spans.pop((invocation_id, agent_name), None)
+    if open_span:
+        _close(open_span)
+
+
+def enter_agent_span(invocation_id, agent_name):
+    """Makes the counters of the current context (model calls, cache hits, retries) go to the agent's span."""
+    _current_span.set((invocation_id, agent_name))
+
+
+def fail_agent_span(invocation_id, agent_name):
+    """Marks the span of an agent run as failed (it is still closed normally)."""
+    with _lock:
+        open_span = _open_spans.get((invocation_id, agent_name))
+        if open_span is not None:
+            open_span["status"] = "error"
@@ -0,0 +1,170 @@
+import json
+import logging
+
+from pydantic import ValidationError
+
+from . import metrics
+from .schemas import STAGE_SCHEMAS
+
+# Reading the JSON results of the agents from their raw text output.
+# The {...} blocks are decoded with the standard decoder straight from the text (Markdown fences and prose
+# around them are skipped) and checked against the schema of the stage.
+
+logger = logging.getLogger(__name__)
+
+_decoder = json.JSONDecoder()
+
+# Repair calls made for one broken response before giving up
+REPAIR_ATTEMPTS = 2
+
+# custom_metadata key marking a response which still breaks the schema after the repair attempts
+# (the LLM cache does not record such responses)
+SCHEMA_ERROR_KEY = "crowdbrew_schema_error"
+
+REPAIR_INSTRUCTION = """
+Popraw poniższą odpowiedź tak, aby była poprawnym JSON-em zgodnym ze schematem.
+Nie zmieniaj treści, nie dodawaj ani nie usuwaj wydarzeń - przepisz dane z odpowiedzi.
+
+BŁĄD: {error}
+
+ODPOWIEDŹ:
+{text}
+"""
+
+
+class SchemaError(ValueError):
+    """Raised when an agent result has no expected JSON structure."""
+
+
+def iter_json_objects(text):
+    """Yields every top-level JSON object found in the text, in order of appearance.
+
+    Every "{" outside of an object already read is tried as the start of one. When it does not begin a
+    valid object (a brace in the prose, a block cut off or broken), the scan goes on from the next brace,
+    so the JSON after it is still found. The decoder stops at the first error, so the cost stays about
+    linear in the length of the text.
+    """
+    position = text.find("{")
+    while position != -1:
+        try:
+            value, end = _decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            position = text.find("{", position + 1)
+            continue
+        yield value
+        position = text.find("{", end)
+
+
+def extract_json(text, key=None):
+    """Returns the last JSON object of the text containing the key (or the last object when none has it)."""
+    found = last = None
+    for value in iter_json_objects(text):
+        last = value
+        if key is not None and key in value:
+            found = value
+    if found is None and last is None:
+        raise SchemaError("No JSON object found in the response.")
+    return found if found is not None else last
+
+
+def validate_items(items, key):
+    """Checks a stage result list against its schema and returns the normalized items.
+
+    Raises SchemaError on a wrong structure.
+    """
+    if not isinstance(items, list):
+        raise SchemaError(f'"{key}" must be a list, got {type(items).__name__}.')
+    schema = STAGE_SCHEMAS.get(key)
+    if schema is None:
+        return items
+    try:
+        return schema.model_validate({key: items}).model_dump(exclude_none=True)[key]
+    except ValidationError as e:
+        details = "; ".join(
+            f'{".".join(str(part) for part in error["loc"])}: {error["msg"]}' for error in e.errors()[:5])
+        raise SchemaError(f'Invalid "{key}" ({e.error_count()} errors): {details}')
+
+
+def parse_stage_output(value, key):
+    """Reads the list stored by an agent under its output_key (e.g. "research_summary").
+
+    The value may be the raw text of the model or an already decoded object.
+    """
+    if isinstance(value, str):
+        value = extract_json(value, key)
+    if isinstance(value, dict):
+        if key in value:
+            value = value[key]
+        elif "facebook_post" in value:
+            value = [value]
+    return validate_items(value, key)
+
+
+def _response_text(llm_response):
+    if not llm_response.content or not llm_response.content.parts:
+        return ""
+    return "".join(part.text for part in llm_response.content.parts if part.text and not part.thought)
+
+
+async def _repair(llm, text, key, error):
+    """Asks the model to rewrite a broken response in the schema (structured output, no tools)."""
+    # Imported on use - parsing is also needed by the paths that never call a model
+    from google.genai import types
+    from google.adk.models import LlmRequest
+
+    request = LlmRequest(
+        model=llm.model,
+        contents=[types.Content(role="user", parts=[
+            types.Part(text=REPAIR_INSTRUCTION.format(error=error, text=text))])],
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=STAGE_SCHEMAS[key],
+        ),
+    )
+    repaired = None
+    async for response in llm.generate_content_async(request):
+        if not response.partial:
+            repaired = response
+    metrics.count("repairs")
+    if repaired and repaired.usage_metadata:
+        metrics.count("prompt_tokens", repaired.usage_metadata.prompt_token_count or 0)
+        metrics.count("completion_tokens", repaired.usage_metadata.candidates_token_count or 0)
+    return _response_text(repaired) if repaired else ""
+
+
+def repair_callback(key):
+    """Creates an after_model_callback which fixes responses not matching the schema of the result key.
+
+    Only the broken JSON is sent back to the model - the search and analysis of the agent are not repeated.
+    The response is fixed in place, so the next callbacks (e.g. the LLM cache) see the repaired version.
+    A response which could not be repaired is marked with SCHEMA_ERROR_KEY in its custom_metadata.
+    """
+    async def after_model_callback(callback_context, llm_response):
+        if llm_response.partial or llm_response.error_code:
+            return None
+        text = _response_text(llm_response)
+        if not text.strip():
+            return None
+        try:
+            parse_stage_output(text, key)
+            return None
+        except SchemaError as e:
+            error = e
+
+        llm = callback_context._invocation_context.agent.canonical_model
+        for attempt in range(1, REPAIR_ATTEMPTS + 1):
+            logger.warning("Repairing %s output (attempt %d): %s", callback_context.agent_name, attempt, error)
+            print(f"🩹 Repairing the {key} JSON (attempt {attempt})...")
+            repaired = await _repair(llm, text, key, error)
+            try:
+                parse_stage_output(repaired, key)
+            except SchemaError as e:
+                error = e
+                continue
+            from google.genai import types
+            llm_response.content = types.Content(role="model", parts=[types.Part(text=repaired)])
+            return None
+        llm_response.custom_metadata = dict(llm_response.custom_metadata or {}, **{SCHEMA_ERROR_KEY: str(error)})
+        return None
+
+    return after_model_callback
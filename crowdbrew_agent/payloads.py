@@ -0,0 +1,137 @@
+import json
+import logging
+
+from .database import SIMILARITY_THRESHOLD, name_similarity, normalize_event_name
+from .parsing import SchemaError, parse_stage_output
+
+# Compact payloads passed between the agents. Each agent only gets the fields it works with (numbered
+# events, short descriptions) and returns only what it creates - the pass-through fields (date, location,
+# description, scoring) are merged back locally by the event number or name instead of being copied by
+# the model.
+
+logger = logging.getLogger(__name__)
+
+# Longest event description passed to the next agent
+MAX_DESCRIPTION_CHARS = 240
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _shorten(text, limit=MAX_DESCRIPTION_CHARS):
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def compact_research(events):
+    """Numbered events with the fields needed to score them (input of impact_agent)."""
+    return _dumps([
+        {"id": number, "name": event.get("event_name"), "place": event.get("location"),
+         "desc": _shorten(event.get("description"))}
+        for number, event in enumerate(events, start=1)
+    ])
+
+
+def compact_impact(events):
+    """Numbered top events with the fields needed to write a bundle (input of the marketing agents)."""
+    return _dumps([
+        {"id": number, "name": event.get("event_name"), "place": event.get("location"),
+         "desc": _shorten(event.get("description")), "why": _shorten(event.get("comments"), 160)}
+        for number, event in enumerate(events, start=1)
+    ])
+
+
+def _find_source(item, sources, names):
+    """The source of an item: by its number when the names agree, otherwise the most similar name."""
+    name = normalize_event_name(item.get("event_name") or "")
+    number = item.get("event_id")
+    by_number = sources[number - 1] if isinstance(number, int) and 1 <= number <= len(sources) else None
+    if by_number is not None and (not name or name_similarity(name, names[number - 1]) >= SIMILARITY_THRESHOLD):
+        return by_number
+
+    by_name, best_score = None, SIMILARITY_THRESHOLD
+    for source, source_name in zip(sources, names):
+        score = name_similarity(name, source_name) if name else 0.0
+        if score > best_score or (by_name is None and score == best_score):
+            by_name, best_score = source, score
+    if by_number is not None:
+        # A miscounted number would attach the scoring of one event to another
+        logger.warning("Event %s is named '%s' but the number points to '%s' - %s", number, item.get("event_name"),
+                       by_number.get("event_name"), "matched by the name" if by_name else "no name matches, number kept")
+    return by_name or by_number
+
+
+def merge_events(items, sources):
+    """Completes the items returned by an agent with the fields of the events they refer to.
+
+    An item refers to its source by "event_id" (number in the compact payload) when its name agrees with
+    the source, otherwise by the most similar event name (the number is kept when no name is similar).
+    Values created by the agent win over the source ones, except the event name.
+    """
+    names = [normalize_event_name(source.get("event_name") or "") for source in sources]
+    merged = []
+    for item in items:
+        source = _find_source(item, sources, names) or {}
+        combined = {**source, **{key: value for key, value in item.items() if value not in (None, "")}}
+        combined.pop("event_id", None)
+        if source.get("event_name"):
+            # The name stays as found by the research, so the database recognizes the event
+            combined["event_name"] = source["event_name"]
+        merged.append(combined)
+    return merged
+
+
+def merge_known_events(known, found):
+    """Known events (local feeds) followed by the found ones which are not duplicates of them."""
+    names = [normalize_event_name(event.get("event_name") or "") for event in known]
+    merged = list(known)
+    for event in found:
+        name = normalize_event_name(event.get("event_name") or "")
+        if all(name_similarity(name, known_name) < SIMILARITY_THRESHOLD for known_name in names):
+            merged.append(event)
+            names.append(name)
+    return merged
+
+
+# --- ADK CALLBACKS ---
+def _stage_items(callback_context, state_key, result_key):
+    """Parsed result of an agent stored in the session state (None when it is unreadable)."""
+    try:
+        return parse_stage_output(callback_context.state.get(state_key), result_key)
+    except SchemaError:
+        return None
+
+
+def _raw(value):
+    return value if isinstance(value, str) else _dumps(value)
+
+
+def _research_events(callback_context):
+    """Known feed events of the session followed by the parsed research result (None when it is unreadable)."""
+    events = _stage_items(callback_context, "research_results", "research_summary")
+    known = callback_context.state.get("feed_events") or []
+    if events is None:
+        return known or None
+    return merge_known_events(known, events)
+
+
+def compact_research_callback(callback_context):
+    """after_agent_callback of research_agent: stores the compact input of impact_agent."""
+    events = _research_events(callback_context)
+    # Unreadable output is passed on as it is - the next agent can still make use of the text
+    callback_context.state["research_compact"] = (
+        compact_research(events) if events is not None else _raw(callback_context.state.get("research_results")))
+    return None
+
+
+def compact_impact_callback(callback_context):
+    """after_agent_callback of impact_agent: stores the compact input of the marketing agents."""
+    top_events = _stage_items(callback_context, "impact_results", "impact_summary")
+    if top_events is None:
+        callback_context.state["impact_compact"] = _raw(callback_context.state.get("impact_results"))
+        return None
+    # Scoring comes from the impact report, places and descriptions from the research
+    research = _research_events(callback_context) or []
+    callback_context.state["impact_compact"] = compact_impact(merge_events(top_events, research))
+    return None
@@ -0,0 +1,60 @@
+from google.genai import types
+from google.adk.plugins.base_plugin import BasePlugin
+
+from . import metrics
+
+# Runner plugins shared by every agent tree (see runners.py). They are kept apart from the modules they
+# report to (metrics.py, checkpoints.py), so those stay free of ADK imports.
+
+
+class ResumePlugin(BasePlugin):
+    """Runner plugin skipping every agent whose output is already in the session state (a resumed stage).
+
+    It must come before the metrics plugin, so skipped agents record no span.
+    """
+
+    def __init__(self):
+        super().__init__(name="crowdbrew_resume")
+
+    async def before_agent_callback(self, *, agent, callback_context):
+        output_key = getattr(agent, "output_key", None)
+        if output_key and callback_context.state.get(output_key) is not None:
+            return types.Content(role="model", parts=[types.Part(text=f"Resumed from checkpoint: {output_key}")])
+        return None
+
+
+class MetricsPlugin(BasePlugin):
+    """Runner plugin recording one span per agent run with the usage of its model calls."""
+
+    def __init__(self):
+        super().__init__(name="crowdbrew_metrics")
+
+    async def before_agent_callback(self, *, agent, callback_context):
+        metrics.open_agent_span(callback_context.invocation_id, agent.name)
+        return None
+
+    async def after_agent_callback(self, *, agent, callback_context):
+        metrics.close_agent_span(callback_context.invocation_id, agent.name)
+        return None
+
+    async def before_model_callback(self, *, callback_context, llm_request):
+        # Runs before the agent's own callbacks, so cache hits and retries find their span
+        metrics.enter_agent_span(callback_context.invocation_id, callback_context.agent_name)
+        metrics.count("model_calls")
+        return None
+
+    async def after_model_callback(self, *, callback_context, llm_response):
+        if llm_response.partial:
+            return None
+        usage = llm_response.usage_metadata
+        if usage:
+            metrics.count("prompt_tokens", usage.prompt_token_count or 0)
+            metrics.count("completion_tokens", usage.candidates_token_count or 0)
+        grounding = llm_response.grounding_metadata
+        if grounding and grounding.web_search_queries:
+            metrics.count("search_queries", len(grounding.web_search_queries))
+        return None
+
+    async def on_model_error_callback(self, *, callback_context, llm_request, error):
+        metrics.fail_agent_span(callback_context.invocation_id, callback_context.agent_name)
+        return None
@@ -0,0 +1,168 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import threading
+import contextvars
+
+from google.genai import errors
+from google.adk.models import Gemini
+
+from . import metrics
+
+# Process-wide scheduler of Gemini calls. All model calls share one token bucket sized to the quota
+# (requests and tokens per minute). Waiting calls are served by priority - interactive requests from
+# the web app go before batch and pre-generation runs - and rate limit errors (429) are retried with
+# jittered, capped backoff while the whole bucket pauses, so concurrent calls do not retry in lockstep.
+
+logger = logging.getLogger(__name__)
+
+# Quota of the model (free tier of gemini-2.5-flash-lite by default)
+REQUESTS_PER_MINUTE = int(os.getenv("CROWDBREW_RPM", 15))
+TOKENS_PER_MINUTE = int(os.getenv("CROWDBREW_TPM", 250_000))
+
+# Tokens reserved for the answer before the real usage is known
+ESTIMATED_OUTPUT_TOKENS = 1024
+
+# Retries of a rate-limited call: full-jitter exponential backoff, capped per wait and in total
+MAX_RETRIES = 6
+BASE_DELAY_SECONDS = 2
+MAX_DELAY_SECONDS = 30
+MAX_TOTAL_DELAY_SECONDS = 120
+
+# Priorities (lower is served first)
+INTERACTIVE = 0
+BATCH = 1
+
+# Priority of the model calls made in the current context - batch runners set it to BATCH
+PRIORITY = contextvars.ContextVar("crowdbrew_priority", default=INTERACTIVE)
+
+_POLL_SECONDS = 0.05
+
+
+class TokenBucket:
+    """Requests-per-minute and tokens-per-minute buckets with a priority queue of waiting calls.
+
+    The state is guarded by a thread lock and waiting is done by short sleeps, so one bucket can be
+    shared by the event loops of different threads (the web app jobs and the terminal mode).
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _try_take(self, ticket, tokens):
+        """Takes the capacity for the ticket and returns 0, or returns the seconds to wait."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._waiting[0] != ticket:
+            return _POLL_SECONDS
+        tokens = min(tokens, self.tokens_per_minute)
+        if self._requests >= 1 and self._tokens >= tokens:
+            self._requests -= 1
+            self._tokens -= tokens
+            heapq.heappop(self._waiting)
+            return 0
+        missing_requests = max(0.0, 1 - self._requests) * 60 / self.requests_per_minute
+        missing_tokens = max(0.0, tokens - self._tokens) * 60 / self.tokens_per_minute
+        return max(missing_requests, missing_tokens, _POLL_SECONDS)
+
+    async def acquire(self, tokens, priority=INTERACTIVE):
+        """Waits until the call may be sent. Calls with a lower priority value are served first."""
+        ticket = (priority, next(self._counter))
+        with self._lock:
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._try_take(ticket, tokens)
+                if not delay:
+                    return
+                await asyncio.sleep(min(delay, 1.0))
+        except BaseException:
+            # A cancelled call leaves the queue
+            with self._lock:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+            raise
+
+    def settle(self, estimated_tokens, used_tokens):
+        """Corrects the token bucket by the difference between the estimate and the real usage."""
+        with self._lock:
+            self._tokens += estimated_tokens - used_tokens
+
+    def pause(self, seconds):
+        """Stops all calls for the given time (after a rate limit error)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+bucket = TokenBucket(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+
+def estimate_tokens(llm_request):
+    """Rough token count of a request (about 4 characters per token) plus the expected answer."""
+    characters = sum(len(part.text or "") for content in llm_request.contents for part in content.parts or [])
+    if llm_request.config and llm_request.config.system_instruction:
+        characters += len(str(llm_request.config.system_instruction))
+    return characters // 4 + ESTIMATED_OUTPUT_TOKENS
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff: a random delay up to BASE * 2^attempt, capped."""
+    return random.uniform(0, min(MAX_DELAY_SECONDS, BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+def _is_rate_limit(error):
+    return isinstance(error, errors.APIError) and error.code == 429
+
+
+class RateLimitedGemini(Gemini):
+    """Gemini model whose calls go through the shared token bucket and retry rate limit errors."""
+
+    async def generate_content_async(self, llm_request, stream=False):
+        estimated = estimate_tokens(llm_request)
+        waited = 0.0
+        attempt = 0
+        while True:
+            await bucket.acquire(estimated, PRIORITY.get())
+            used = None
+            started = False
+            try:
+                async for llm_response in super().generate_content_async(llm_request, stream):
+                    started = True
+                    if llm_response.usage_metadata and llm_response.usage_metadata.total_token_count:
+                        used = llm_response.usage_metadata.total_token_count
+                    yield llm_response
+                return
+            except errors.APIError as e:
+                if started or not _is_rate_limit(e) or attempt >= MAX_RETRIES or waited >= MAX_TOTAL_DELAY_SECONDS:
+                    raise
+                delay = min(backoff_delay(attempt), MAX_TOTAL_DELAY_SECONDS - waited)
+                attempt += 1
+                waited += delay
+                logger.warning("Rate limited (429), retry %d in %.1fs", attempt, delay)
+                metrics.count("retries")
+                bucket.pause(delay)
+                await asyncio.sleep(delay)
+            finally:
+                bucket.settle(estimated, used if used is not None else estimated)
@@ -0,0 +1,81 @@
+import time
+import logging
+from contextlib import asynccontextmanager
+
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.memory import InMemoryMemoryService
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+from .plugins import MetricsPlugin, ResumePlugin
+
+# Process-wide runners shared by all requests. Every agent tree gets one runner (created on first use),
+# all runners share one session service - a request only creates a short-lived session and removes it
+# when it ends. The agents (and the Gemini client of their model) live as long as the process, so
+# HTTP connections are kept alive between requests.
+
+logger = logging.getLogger(__name__)
+
+USER_ID = "crowdbrew_user"
+
+# Sessions left behind by interrupted requests are removed after this time without updates
+SESSION_IDLE_SECONDS = 15 * 60
+CLEANUP_INTERVAL_SECONDS = 60
+
+session_service = InMemorySessionService()
+_artifact_service = InMemoryArtifactService()
+_memory_service = InMemoryMemoryService()
+# Resume goes first - an agent skipped from a checkpoint records no span
+_plugins = [ResumePlugin(), MetricsPlugin()]
+
+_runners = {}
+_last_cleanup = 0.0
+
+
+def get_runner(name, agent_factory):
+    """Returns the shared runner registered under the name, building its agent with agent_factory on first use."""
+    runner = _runners.get(name)
+    if runner is None:
+        runner = Runner(
+            app_name=name,
+            agent=agent_factory(),
+            session_service=session_service,
+            artifact_service=_artifact_service,
+            memory_service=_memory_service,
+            plugins=_plugins,
+        )
+        _runners[name] = runner
+    return runner
+
+
+async def cleanup_idle_sessions(max_idle_seconds=SESSION_IDLE_SECONDS):
+    """Deletes sessions not updated for max_idle_seconds. Returns the number of removed sessions."""
+    global _last_cleanup
+    _last_cleanup = time.time()
+    removed = 0
+    for name in list(_runners):
+        try:
+            response = await session_service.list_sessions(app_name=name, user_id=USER_ID)
+        except RuntimeError:
+            # The session dict changed size under a concurrent request - the next sweep retries
+            continue
+        for session in response.sessions:
+            if session.last_update_time + max_idle_seconds < _last_cleanup:
+                await session_service.delete_session(app_name=name, user_id=USER_ID, session_id=session.id)
+                removed += 1
+    if removed:
+        logger.info("Removed %d idle sessions", removed)
+    return removed
+
+
+@asynccontextmanager
+async def open_session(runner, state=None):
+    """Creates a session for one request on a shared runner and deletes it when the request ends."""
+    if time.time() - _last_cleanup > CLEANUP_INTERVAL_SECONDS:
+        await cleanup_idle_sessions()
+    session = await runner.session_service.create_session(app_name=runner.app_name, user_id=USER_ID, state=state)
+    try:
+        yield session
+    finally:
+        await runner.session_service.delete_session(
+            app_name=runner.app_name, user_id=USER_ID, session_id=session.id)
@@ -0,0 +1,64 @@
+from typing import List, Literal
+
+from pydantic import BaseModel, Field
+
+# Typed structure of the agent results - used as the response schema of the model where the tools allow it
+# (marketing) and for the local validation of the research and impact results (google_search excludes
+# structured output on the Gemini API).
+
+
+class ResearchEvent(BaseModel):
+    event_date: str = Field(description="Data w formacie YYYY-MM-DD")
+    event_name: str = Field(description="Dokładna nazwa wydarzenia")
+    location: str = Field("", description="Konkretne miejsce, np. Manufaktura")
+    description: str = Field("", description="Krótki, merytoryczny opis wydarzenia")
+
+
+class ScoreBreakdown(BaseModel):
+    frekwencja: int
+    zasięg: int
+    zgodność: int
+    różnorodność: int
+    optymizm: int
+
+
+# The impact and marketing agents only return what they create - the date, place and description of an
+# event are merged back locally (see payloads.py)
+class ImpactEvent(BaseModel):
+    event_id: int = Field(0, description="Numer (id) wydarzenia z raportu")
+    event_name: str = Field(description="Dokładna nazwa wydarzenia z raportu")
+    impact_score: int = Field(description="Punktacja 1-100")
+    score_breakdown: ScoreBreakdown
+    comments: str = Field("", description="Krótkie uzasadnienie wyboru wydarzenia")
+
+
+class MenuItem(BaseModel):
+    name: str
+    desc: str
+    type: Literal["coffee", "cake"]
+
+
+class MarketingBundle(BaseModel):
+    event_name: str = Field(description="Dokładna nazwa wydarzenia z raportu")
+    facebook_post: str
+    menu_items: List[MenuItem]
+
+
+class ResearchSummary(BaseModel):
+    research_summary: List[ResearchEvent]
+
+
+class ImpactSummary(BaseModel):
+    impact_summary: List[ImpactEvent]
+
+
+class MarketingOutput(BaseModel):
+    output: List[MarketingBundle]
+
+
+# Result schema by the key of the result list
+STAGE_SCHEMAS = {
+    "research_summary": ResearchSummary,
+    "impact_summary": ImpactSummary,
+    "output": MarketingOutput,
+}
@@ -0,0 +1,210 @@
+import re
+
+from . import database
+from .dates import fold
+
+# Full-text search over the generated archive (events, menu items and posts).
+# FTS5 tables mirror Events/Menu/Posts and are kept in sync by triggers.
+
+TOKENIZER = "unicode61 remove_diacritics 2"
+
+KINDS = ("event", "menu", "post")
+
+_STOPWORDS = {"i", "w", "we", "z", "na", "do", "o", "dla", "oraz", "a", "the", "of", "and"}
+
+# External-content indexes (the text is read back from the source table)
+_FTS_TABLES = {
+    "EventsFts": ("Events", ["name", "location", "description"]),
+    "PostsFts": ("Posts", ["content"]),
+}
+
+
+def create_search_tables(cur):
+    """Creates the FTS5 tables with their sync triggers (the index is rebuilt when a table is new)."""
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (?, ?, ?)",
+                (*_FTS_TABLES, "MenuFts"))
+    existing = {row[0] for row in cur.fetchall()}
+
+    for fts_table, (table, columns) in _FTS_TABLES.items():
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+
+        cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+            {column_list}, content='{table}', content_rowid='id', tokenize='{TOKENIZER}'
+        )
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+        """)
+        # Only changes of indexed columns touch the index (Events.rank is updated on every save)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """)
+
+        if fts_table not in existing:
+            cur.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+    # Menu items are indexed together with the text of their event, so one query can combine
+    # both ("ciasto komiks" = cakes created for comic festivals)
+    event_text = "(SELECT name || ' ' || COALESCE(description, '') FROM Events WHERE id = new.event_id)"
+    cur.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS MenuFts USING fts5(
+        item_name, item_description, event_text, tokenize='{TOKENIZER}'
+    )
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS MenuFts_ai AFTER INSERT ON Menu BEGIN
+        INSERT INTO MenuFts(rowid, item_name, item_description, event_text)
+        VALUES (new.id, new.item_name, new.item_description, {event_text});
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS MenuFts_ad AFTER DELETE ON Menu BEGIN
+        DELETE FROM MenuFts WHERE rowid = old.id;
+    END
+    """)
+    cur.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS MenuFts_au AFTER UPDATE OF item_name, item_description, event_id ON Menu BEGIN
+        DELETE FROM MenuFts WHERE rowid = old.id;
+        INSERT INTO MenuFts(rowid, item_name, item_description, event_text)
+        VALUES (new.id, new.item_name, new.item_description, {event_text});
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS MenuFts_event_au AFTER UPDATE OF name, description ON Events BEGIN
+        UPDATE MenuFts SET event_text = new.name || ' ' || COALESCE(new.description, '')
+        WHERE rowid IN (SELECT id FROM Menu WHERE event_id = new.id);
+    END
+    """)
+    if "MenuFts" not in existing:
+        cur.execute("""
+        INSERT INTO MenuFts(rowid, item_name, item_description, event_text)
+        SELECT m.id, m.item_name, m.item_description, e.name || ' ' || COALESCE(e.description, '')
+        FROM Menu m LEFT JOIN Events e ON e.id = m.event_id
+        """)
+
+
+def _stem(word):
+    """Crude Polish stemming - cuts the inflected ending so "komiksów" also finds "komiks"."""
+    if len(word) <= 4:
+        return word[:max(3, len(word) - 1)]
+    if len(word) <= 6:
+        return word[:-2]
+    return word[:-3]
+
+
+def build_match_query(query, match_any=False):
+    """Turns free text into an FTS5 query of prefix terms ("festiwal komiksu" -> "festi"* AND "komi"*)."""
+    words = [word for word in re.findall(r"\w+", fold(query)) if word not in _STOPWORDS]
+    terms = [f'"{_stem(word)}"*' for word in words]
+    return (" OR " if match_any else " AND ").join(terms)
+
+
+def _filters(date_from, date_to, item_type=None, min_score=None):
+    clauses, params = [], []
+    if date_from:
+        clauses.append("e.date >= ?")
+        params.append(date_from)
+    if date_to:
+        clauses.append("e.date <= ?")
+        params.append(date_to)
+    if item_type:
+        clauses.append("m.item_type = ?")
+        params.append(item_type)
+    if min_score is not None:
+        clauses.append("e.impact_score >= ?")
+        params.append(min_score)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def _search_events(cur, match, date_from, date_to, min_score, limit):
+    where, params = _filters(date_from, date_to, min_score=min_score)
+    cur.execute(f"""
+        SELECT e.id, e.id, e.date, e.name, e.name,
+               snippet(EventsFts, 2, '[', ']', '…', 12), bm25(EventsFts) AS score
+        FROM EventsFts JOIN Events e ON e.id = EventsFts.rowid
+        WHERE EventsFts MATCH ?{where}
+        ORDER BY score LIMIT ?
+    """, [match, *params, limit])
+    return cur.fetchall()
+
+
+def _search_menu(cur, match, date_from, date_to, item_type, min_score, limit):
+    # Matches in the item itself weigh more than matches in the text of its event
+    where, params = _filters(date_from, date_to, item_type, min_score)
+    cur.execute(f"""
+        SELECT m.id, e.id, e.date, e.name, m.item_name, m.item_description,
+               bm25(MenuFts, 4.0, 2.0, 1.0) AS score
+        FROM MenuFts
+        JOIN Menu m ON m.id = MenuFts.rowid
+        JOIN Events e ON e.id = m.event_id
+        WHERE MenuFts MATCH ?{where}
+        ORDER BY score LIMIT ?
+    """, [match, *params, limit])
+    return cur.fetchall()
+
+
+def _search_posts(cur, match, date_from, date_to, min_score, limit):
+    where, params = _filters(date_from, date_to, min_score=min_score)
+    cur.execute(f"""
+        SELECT p.id, e.id, e.date, e.name, e.name,
+               snippet(PostsFts, 0, '[', ']', '…', 16), bm25(PostsFts) AS score
+        FROM PostsFts
+        JOIN Posts p ON p.id = PostsFts.rowid
+        JOIN Events e ON e.id = p.event_id
+        WHERE PostsFts MATCH ?{where}
+        ORDER BY score LIMIT ?
+    """, [match, *params, limit])
+    return cur.fetchall()
+
+
+def search(query, kinds=KINDS, date_from=None, date_to=None, item_type=None, min_score=None,
+           limit=20, offset=0, match_any=False):
+    """Ranked full-text search over the archive.
+
+    kinds selects "event", "menu" and/or "post" hits, item_type filters menu items ("coffee", "cake"),
+    date_from/date_to (YYYY-MM-DD) and min_score filter by the event. Returns a page of hits (best first)
+    as dicts with kind, id, event_id, event_date, event_name, title, snippet and score.
+    """
+    match = build_match_query(query, match_any)
+    if not match:
+        return []
+
+    # Every kind returns enough rows to fill the requested page after merging
+    window = offset + limit
+    with database.get_connection() as conn:
+        cur = conn.cursor()
+        hits = []
+        if "event" in kinds and not item_type:
+            hits += [("event", *row) for row in _search_events(cur, match, date_from, date_to, min_score, window)]
+        if "menu" in kinds:
+            hits += [("menu", *row) for row in _search_menu(cur, match, date_from, date_to, item_type, min_score, window)]
+        if "post" in kinds and not item_type:
+            hits += [("post", *row) for row in _search_posts(cur, match, date_from, date_to, min_score, window)]
+
+    hits.sort(key=lambda hit: hit[-1])
+    return [
+        {
+            "kind": kind,
+            "id": hit_id,
+            "event_id": event_id,
+            "event_date": event_date,
+            "event_name": event_name,
+            "title": title,
+            "snippet": snippet,
+            "score": round(-score, 6),
+        }
+        for kind, hit_id, event_id, event_date, event_name, title, snippet, score in hits[offset:window]
+    ]
@@ -4,11 +4,19 @@ import os
 from main import process_request
 
 # --- AUTO-SAVING CODE ---
+# Size of the file buffer - the copy is written to disk in blocks instead of on every print
+LOG_BUFFER_BYTES = 64 * 1024
+
+
 class DualLogger:
-    """This class acts as a 'splitter'."""
-    def __init__(self, filename):
+    """This class acts as a 'splitter'.
+
+    The terminal gets every message at once, the file copy is buffered and written when the buffer
+    is full, on flush() and on close().
+    """
+    def __init__(self, filename, buffer_size=LOG_BUFFER_BYTES):
         self.terminal = sys.stdout
-        self.log = open(filename, "w", encoding='utf-8')
+        self.log = open(filename, "w", encoding='utf-8', buffering=buffer_size)
 
     def write(self, message):
         self.terminal.write(message)
@@ -18,6 +26,9 @@ class DualLogger:
         self.terminal.flush()
         self.log.flush()
 
+    def close(self):
+        self.log.close()
+
 
 async def run_evaluation():
     """Evaluates the performance of Agent."""
@@ -67,6 +78,11 @@ if __name__ == "__main__":
     output_path = os.path.join(LOG_DIR, "evaluation_output.txt")
     
     # --- SAVE ACTIVATION ---
-    sys.stdout = DualLogger(output_path)
+    dual_logger = DualLogger(output_path)
+    sys.stdout = dual_logger
     
-    asyncio.run(run_evaluation())
\ No newline at end of file
+    try:
+        asyncio.run(run_evaluation())
+    finally:
+        sys.stdout = dual_logger.terminal
+        dual_logger.close()
\ No newline at end of file
@@ -0,0 +1,172 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+from dataclasses import dataclass, field
+
+from main import stream_request, PipelineEvent
+from crowdbrew_agent import dates
+
+# Background job queue for the front end. Pipelines run on one long-lived event loop in a worker thread,
+# so a click never blocks the Streamlit script and the shared runners keep their connections.
+# Identical date queries already in flight are merged into one job (single-flight).
+
+# Pipelines running at the same time (the other jobs wait in the queue)
+MAX_WORKERS = int(os.getenv("CROWDBREW_JOB_WORKERS", 2))
+
+# Pre-generation of the upcoming dates on the job loop (scheduler.py), started by the web app
+SCHEDULER_ENABLED = os.getenv("CROWDBREW_SCHEDULER", "0") == "1"
+
+# Finished jobs are kept this long, so a refreshed page can still show their results
+JOB_RETENTION_SECONDS = 60 * 60
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+@dataclass
+class Job:
+    """A pipeline run for one date query.
+
+    status is "queued", "running", "done" or "error"; events holds every PipelineEvent reported so far.
+    """
+    id: str
+    query: str
+    force_refresh: bool = False
+    key: tuple = None
+    status: str = "queued"
+    events: list = field(default_factory=list)
+    result: list = None
+    error: str = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = None
+
+
+_jobs = {}
+# Deduplication key -> ID of the job in flight
+_inflight = {}
+# Guards the job registry and wakes up the readers of new events
+_changed = threading.Condition()
+
+_loop = None
+_semaphore = None
+_scheduler = None
+
+
+def _dedup_key(query, force_refresh):
+    """Queries resolving to the same date are the same job ("27 września 2025" == "2025-09-27")."""
+    return (dates.normalize_date(query) or dates.fold(query).strip(), force_refresh)
+
+
+def _ensure_loop():
+    global _loop, _semaphore
+    with _changed:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _semaphore = asyncio.Semaphore(max(1, MAX_WORKERS))
+            threading.Thread(target=_loop.run_forever, name="crowdbrew-jobs", daemon=True).start()
+    return _loop
+
+
+def _publish(job, event):
+    with _changed:
+        job.events.append(event)
+        if event.stage == "done":
+            job.result = event.data
+        elif event.stage == "error":
+            job.error = event.data
+        _changed.notify_all()
+
+
+def _finish(job):
+    with _changed:
+        job.status = "error" if job.error and not job.result else "done"
+        job.finished_at = time.time()
+        if _inflight.get(job.key) == job.id:
+            del _inflight[job.key]
+        _changed.notify_all()
+
+
+async def _run(job):
+    async with _semaphore:
+        with _changed:
+            job.status = "running"
+            _changed.notify_all()
+        try:
+            async for event in stream_request(job.query, force_refresh=job.force_refresh):
+                _publish(job, event)
+        except Exception as e:
+            _publish(job, PipelineEvent("error", str(e)))
+        finally:
+            _finish(job)
+
+
+def _purge_finished():
+    limit = time.time() - JOB_RETENTION_SECONDS
+    for job_id, job in list(_jobs.items()):
+        if job.finished_at and job.finished_at < limit:
+            del _jobs[job_id]
+
+
+def submit(query, force_refresh=False):
+    """Queues the pipeline for a date query and returns the job ID.
+
+    When the same date is already queued or running, the ID of that job is returned instead.
+    """
+    key = _dedup_key(query, force_refresh)
+    loop = _ensure_loop()
+    with _changed:
+        _purge_finished()
+        job_id = _inflight.get(key)
+        if job_id:
+            print(f"🔗 [{query}] Joined the job already in progress ({job_id[:8]}).")
+            return job_id
+        job = Job(id=uuid.uuid4().hex, query=query, force_refresh=force_refresh, key=key)
+        _jobs[job.id] = job
+        _inflight[key] = job.id
+    asyncio.run_coroutine_threadsafe(_run(job), loop)
+    return job.id
+
+
+def start_scheduler():
+    """Runs the pre-generation service (scheduler.py) on the job loop, once per process.
+
+    Sharing the loop puts its model calls into the same rate limiter as the jobs, which go first.
+    """
+    global _scheduler
+    import scheduler
+
+    loop = _ensure_loop()
+    with _changed:
+        if _scheduler is None:
+            _scheduler = asyncio.run_coroutine_threadsafe(scheduler.serve(), loop)
+    return _scheduler
+
+
+def get_job(job_id):
+    """Returns the Job with the given ID (None when unknown or already purged)."""
+    with _changed:
+        return _jobs.get(job_id)
+
+
+def stream(job_ids, poll_seconds=1.0):
+    """Yields (query, PipelineEvent) pairs of the jobs from their first event, blocking until all of them end."""
+    cursors = dict.fromkeys(job_ids, 0)
+    while True:
+        with _changed:
+            pending = []
+            running = False
+            for job_id in job_ids:
+                job = _jobs.get(job_id)
+                if not job:
+                    continue
+                new_events = job.events[cursors[job_id]:]
+                cursors[job_id] += len(new_events)
+                pending.extend((job.query, event) for event in new_events)
+                running = running or job.status in ACTIVE_STATUSES
+            if not pending and running:
+                _changed.wait(poll_seconds)
+                continue
+        yield from pending
+        if not running:
+            return
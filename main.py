@@ -1,104 +1,532 @@
 import os
-import json
-import re
+import time
+import uuid
 import asyncio
+import argparse
+from dataclasses import dataclass
 from dotenv import load_dotenv, find_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from google.adk.runners import InMemoryRunner
-from crowdbrew_agent.agent import root_agent
-from crowdbrew_agent import database
+from crowdbrew_agent import cafes, checkpoints, database, dates, feeds, llm_cache, metrics, parsing, payloads, search
+
+# google.adk and the agents (crowdbrew_agent.agent, runners, rate_limit) are imported by the functions that
+# run them, so the web app and the database-only commands start without loading them
 
 # Load environment variables
 _ = load_dotenv(find_dotenv())
 
+# How long a stored bundle is served from the database before the agents are run again
+BUNDLE_MAX_AGE_HOURS = 72
+
+# Extra attempts for a single marketing bundle which failed (the other bundles are kept)
+MARKETING_RETRIES = 1
+
+
+@dataclass
+class PipelineEvent:
+    """A step of the pipeline reported by stream_request() as soon as it happens.
+
+    stage is one of:
+      "stored"   - a fresh bundle was found in the database (data: list of items, no model calls follow)
+      "research" - research_agent finished (data: list of found events)
+      "impact"   - impact_agent finished (data: list of the top events with scores)
+      "bundle"   - one marketing bundle is ready (data: single item)
+      "done"     - the result is saved (data: list of items with db_id)
+      "error"    - the run failed (data: error message)
+    """
+    stage: str
+    data: object = None
+    date: str = None
+
+
+def expand_queries(queries):
+    """Splits queries describing date ranges ("27-28 września") into one YYYY-MM-DD query per day."""
+    expanded = []
+    for query in queries:
+        found = dates.normalize_dates(query)
+        expanded.extend(found if len(found) > 1 else [query])
+    return expanded
+
+
+def _parse_bundle(value, event_number, target_date, top_events):
+    """Reads the bundle of one marketing agent (None when the output is empty or broken).
+
+    The bundle only holds the menu and the post - the event fields and scoring come from top_events.
+    """
+    try:
+        items = parsing.parse_stage_output(value, "output")
+    except parsing.SchemaError as e:
+        print(f"❌ JSON parsing error in bundle {event_number}: {e}")
+        return None
+    if not items or not isinstance(items[0], dict):
+        return None
+    item = payloads.merge_events([dict(items[0], event_id=event_number)], top_events)[0]
+    # The locally resolved date wins over the one reported by the model
+    item["event_date"] = target_date or item.get("event_date", datetime.now().strftime("%Y-%m-%d"))
+    print(f"   ➕ [{item['event_date']}] Processing: {item.get('event_name', 'Wydarzenie Nieznane')}")
+    return item
+
+
+async def _retry_bundle(event_number, top_events, target_date, message, cafe):
+    """Generates a single marketing bundle again, from the stored impact report only."""
+    from crowdbrew_agent import runners
+    from crowdbrew_agent.agent import build_marketing_agent, marketing_output_key
+
+    # The retry agent lives outside the root agent tree, in a runner of its own
+    runner = runners.get_runner(f"marketing_retry_{event_number}", lambda: build_marketing_agent(event_number))
+
+    key = marketing_output_key(event_number)
+    try:
+        state = dict(cafe.state(), impact_compact=payloads.compact_impact(top_events))
+        async with runners.open_session(runner, state=state) as session:
+            async for event in runner.run_async(user_id=runners.USER_ID, session_id=session.id, new_message=message):
+                state_delta = event.actions.state_delta if event.actions else {}
+                if key in state_delta:
+                    return _parse_bundle(state_delta[key], event_number, target_date, top_events)
+    except Exception as e:
+        print(f"❌ Retry of bundle {event_number} failed: {e}")
+    return None
+
+
+def _resume_state(checkpoint):
+    """Session state of a resumed run: the checkpointed outputs and the compact agent inputs made from them."""
+    from crowdbrew_agent.agent import marketing_output_key, TOP_EVENTS
+
+    state = {}
+    if "research_results" in checkpoint:
+        state["research_results"] = {"research_summary": checkpoint["research_results"]}
+        state["research_compact"] = payloads.compact_research(checkpoint["research_results"])
+    if "impact_results" in checkpoint:
+        state["impact_results"] = {"impact_summary": checkpoint["impact_results"]}
+        state["impact_compact"] = payloads.compact_impact(checkpoint["impact_results"])
+    for event_number in range(1, TOP_EVENTS + 1):
+        key = marketing_output_key(event_number)
+        if key in checkpoint:
+            state[key] = checkpoint[key]
+    return state
+
 
-def extract_json_from_response(response_object):
-    """Extracts clean JSON from the raw agent response."""
-    text = str(response_object)
-    
-    # 1. Try finding Markdown code block containing JSON
-    matches = re.findall(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-    if matches:
-        for json_candidate in reversed(matches):
-            if '"output"' in json_candidate:
-                return json_candidate
-        return matches[-1]
-
-    # 2. Try finding specific output key structure
-    match_struct = re.search(r'(\{\s*"output":\s*\[.*?\]\s*\})', text, re.DOTALL)
-    if match_struct: return match_struct.group(1)
-
-    # 3. Fallback: Find the last JSON-like structure
-    matches_raw = list(re.finditer(r'\{.*\}', text, re.DOTALL))
-    if matches_raw:
-        for match in reversed(matches_raw):
-            candidate = match.group(0)
-            if '"output"' in candidate: return candidate
-                
-    return text
-
-
-async def process_request(user_date_query):
+async def _save_checkpoint(run_id, target_date, stage, value, cafe):
+    # Checkpoints are keyed by the date - queries without a resolved date are not resumable
+    if target_date:
+        await database.run_async(checkpoints.save_checkpoint, run_id, target_date, stage, value, cafe.id)
+
+
+def _stored_bundles(target_date, cafe):
+    if cafe.id == cafes.DEFAULT_CAFE_ID:
+        return database.get_marketing_bundles(target_date, max_age_hours=BUNDLE_MAX_AGE_HOURS)
+    return cafes.get_cafe_bundles(cafe.id, target_date, max_age_hours=BUNDLE_MAX_AGE_HOURS)
+
+
+def _save_results(items, cafe):
+    if cafe.id == cafes.DEFAULT_CAFE_ID:
+        return database.save_results(items)
+    return cafes.save_cafe_results(cafe.id, items, cafe.city)
+
+
+async def stream_request(user_date_query, force_refresh=False, resume=True, cafe=None, research=None):
+    """Runs the pipeline for one date query and yields PipelineEvents as each stage finishes.
+
+    With resume set, an unfinished run for the same date continues from its last checkpoint. cafe is the
+    CafeProfile the proposals are made for (the default café for None); research is a list of events found
+    by another run for the same city and date, which is then used instead of running research_agent.
+    """
+    cafe = cafe or cafes.DEFAULT_CAFE
+    # Every span recorded below (agents, database write) is tagged with the run ID and the date
+    run_id = uuid.uuid4().hex[:12]
+    metrics.start_run(run_id, dates.normalize_date(user_date_query))
+    # A forced refresh must not get the recorded model responses back from the LLM cache
+    llm_cache.REFRESH.set(force_refresh)
+    started = time.perf_counter()
+    status, source = "error", "agents"
+    try:
+        async for event in _run_pipeline(user_date_query, force_refresh, resume, run_id, cafe, research):
+            if event.stage == "stored":
+                source = "database"
+            elif event.stage == "done":
+                status = "ok"
+            yield event
+    finally:
+        metrics.end_run()
+        metrics.record_span({"stage": "pipeline", "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+                             "status": status, "source": source, "cafe": cafe.id})
+
+
+def _load_agents():
+    import crowdbrew_agent.agent
+    import crowdbrew_agent.runners
+
+
+async def _run_pipeline(user_date_query, force_refresh, resume, run_id, cafe, research):
     print("💽 Initializing database...")
-    database.init_db()
+    await database.run_async(database.init_db)
+
+    # Deterministic date resolution - the agents, the LLM cache and the database all get the same date
+    target_date = dates.normalize_date(user_date_query)
+
+    # Read-through: a fresh bundle already stored for this date is returned without any model calls
+    if target_date and not force_refresh:
+        stored_items = await database.run_async(_stored_bundles, target_date, cafe)
+        if stored_items:
+            print(f"\n⚡ [{target_date}] Served {len(stored_items)} stored proposals from the database.")
+            yield PipelineEvent("stored", stored_items, target_date)
+            for item in stored_items:
+                yield PipelineEvent("bundle", item, target_date)
+            yield PipelineEvent("done", stored_items, target_date)
+            return
+
+    # The agents are only loaded when they have to run (a stored bundle needs no google.adk import).
+    # The first import takes seconds, so it is done in a worker thread instead of stalling the event loop.
+    await asyncio.to_thread(_load_agents)
+    from google.genai import types
+    from crowdbrew_agent import runners
+    from crowdbrew_agent.agent import get_root_agent, marketing_output_key, TOP_EVENTS
+
+    print(f"\n🤖 CrowdBrew processes: {user_date_query}")
 
-    print("\n🤖 CrowdBrew processes: {user_date_query}")
+    runner = runners.get_runner("crowdbrew_agent", get_root_agent)
+    message = types.Content(role="user", parts=[types.Part(text=target_date or user_date_query)])
 
-    runner = InMemoryRunner(agent=root_agent)
-    response = await runner.run_debug(user_date_query)
+    # Marketing bundles by event number - the parallel agents finish in any order
+    bundles = {}
+    found_events = []
+    top_events = None
 
-    processed_items = []
+    # Resume: the stages checkpointed by an unfinished run are put into the session state and skipped
+    checkpoint = {}
+    if target_date and resume and not force_refresh:
+        resumed_run_id, checkpoint = await database.run_async(
+            checkpoints.load_checkpoints, target_date, cafe_id=cafe.id)
+        if resumed_run_id:
+            run_id = resumed_run_id
+            print(f"♻️ [{target_date}] Resuming run {run_id} ({', '.join(sorted(checkpoint))} checkpointed).")
+
+    # Research shared by the cafés of one city is checkpointed like a finished stage of this run
+    if research is not None and "research_results" not in checkpoint:
+        print(f"🤝 [{target_date}] {cafe.name}: using the shared research ({len(research)} events).")
+        checkpoint["research_results"] = research
+        await _save_checkpoint(run_id, target_date, "research_results", research, cafe)
+
+    # Local event feeds come before google_search: with enough known events the research is not run at all,
+    # otherwise research_agent only looks for the events missing from the feeds.
+    # The feeds are venue calendars of the default city, so cafés of other cities skip them.
+    feed_events = []
+    if target_date and "research_results" not in checkpoint and cafe.city == cafes.DEFAULT_CAFE.city:
+        await database.run_async(feeds.refresh_feeds)
+        feed_events = await database.run_async(feeds.events_for_date, target_date)
+        if len(feed_events) >= feeds.MIN_FEED_EVENTS:
+            print(f"📅 [{target_date}] {len(feed_events)} events found in the local feeds - search skipped.")
+            checkpoint["research_results"], feed_events = feed_events, []
+            await _save_checkpoint(run_id, target_date, "research_results", checkpoint["research_results"], cafe)
+    if "research_results" in checkpoint:
+        found_events = checkpoint["research_results"]
+        yield PipelineEvent("research", found_events, target_date)
+    if "impact_results" in checkpoint:
+        top_events = checkpoint["impact_results"]
+        yield PipelineEvent("impact", top_events, target_date)
+    for event_number in range(1, TOP_EVENTS + 1):
+        item = checkpoint.get(marketing_output_key(event_number))
+        if item:
+            bundles[event_number] = item
+            yield PipelineEvent("bundle", item, target_date)
+
+    state = dict(_resume_state(checkpoint), **cafe.state())
+    if feed_events:
+        print(f"📅 [{target_date}] {len(feed_events)} events found in the local feeds - searching for more.")
+        state["feed_events"] = feed_events
+        state["known_events"] = payloads.compact_research(feed_events)
 
     try:
-        print("\n🔄 Parsing response to JSON...")
-        json_str = extract_json_from_response(response)
-        data = json.loads(json_str)
-        print("✅ Success! JSON data received.")
-        
-        output_items = data.get("output", [])
-        if not output_items:
-             if isinstance(data, list): output_items = data
-             elif isinstance(data, dict) and "facebook_post" in data: output_items = [data]
-
-        # --- Write Loop ---
-        for item in output_items:
-            ai_date = item.get("event_date", datetime.now().strftime("%Y-%m-%d"))
-            
-            real_event_name = item.get("event_name", "Wydarzenie Nieznane")
-            real_location = item.get("location", "Łódź (nieokreślone)")
-            real_description = item.get("description", "Brak opisu")
-            
-            print(f"   ➕ [{ai_date}] Processing: {real_event_name}")
-
-            # Save Event
-            current_event_id = database.add_event(
-                date=ai_date,
-                name=real_event_name,
-                location=real_location,
-                description=real_description
-            )
-            
-            # Save Marketing Content
-            database.add_marketing_bundle(current_event_id, item)
-
-            item['db_id'] = current_event_id
-            processed_items.append(item)
-
-        return processed_items
-            
-    except json.JSONDecodeError:
-        print(f"\n❌ JSON parsing error. Agent returned:\n{json_str[:200]}...")
-        return []
+        async with runners.open_session(runner, state=state) as session:
+            async for event in runner.run_async(user_id=runners.USER_ID, session_id=session.id, new_message=message):
+                state_delta = event.actions.state_delta if event.actions else {}
+
+                if "research_results" in state_delta:
+                    found_events = payloads.merge_known_events(
+                        feed_events, parsing.parse_stage_output(state_delta["research_results"], "research_summary"))
+                    print(f"🕵️ Research finished: {len(found_events)} events found.")
+                    await _save_checkpoint(run_id, target_date, "research_results", found_events, cafe)
+                    yield PipelineEvent("research", found_events, target_date)
+
+                if "impact_results" in state_delta:
+                    # Places and descriptions are not repeated by the model - they come from the research
+                    top_events = payloads.merge_events(
+                        parsing.parse_stage_output(state_delta["impact_results"], "impact_summary"), found_events)
+                    print(f"🧠 Impact analysis finished: {len(top_events)} events selected.")
+                    await _save_checkpoint(run_id, target_date, "impact_results", top_events, cafe)
+                    yield PipelineEvent("impact", top_events, target_date)
+
+                for event_number in range(1, TOP_EVENTS + 1):
+                    key = marketing_output_key(event_number)
+                    if key in state_delta:
+                        item = _parse_bundle(state_delta[key], event_number, target_date, top_events or [])
+                        if item:
+                            bundles[event_number] = item
+                            yield PipelineEvent("bundle", item, target_date)
+    except parsing.SchemaError as e:
+        print(f"\n❌ JSON parsing error: {e}")
+        yield PipelineEvent("error", f"JSON parsing error: {e}", target_date)
+        return
+    except Exception as e:
+        # A failure after the impact stage still leaves the bundles of the other events usable
+        if top_events is None:
+            raise
+        print(f"\n⚠️ Marketing stage interrupted: {e}")
+
+    # The bundles are checkpointed once the parallel stage is over - an await inside the loop above runs
+    # within the TaskGroup of the stage, which cancels it when a marketing agent fails
+    for event_number in sorted(bundles):
+        key = marketing_output_key(event_number)
+        if key not in checkpoint:
+            await _save_checkpoint(run_id, target_date, key, bundles[event_number], cafe)
+
+    # Only the missing bundles are generated again, each on its own runner and all of them concurrently
+    missing = [event_number for event_number in range(1, min(len(top_events or []), TOP_EVENTS) + 1)
+               if event_number not in bundles]
+    for _ in range(MARKETING_RETRIES):
+        if not missing:
+            break
+        print(f"🔁 Retrying the marketing bundles for events {', '.join(map(str, missing))}...")
+        retried = await asyncio.gather(
+            *(_retry_bundle(event_number, top_events, target_date, message, cafe) for event_number in missing))
+        for event_number, item in zip(missing, retried):
+            if item:
+                bundles[event_number] = item
+                await _save_checkpoint(run_id, target_date, marketing_output_key(event_number), item, cafe)
+                yield PipelineEvent("bundle", item, target_date)
+        missing = [event_number for event_number in missing if event_number not in bundles]
+
+    output_items = [bundles[event_number] for event_number in sorted(bundles)]
+    if not output_items:
+        yield PipelineEvent("error", "The agents returned no proposals.", target_date)
+        return
+
+    try:
+        # --- Write (events, menus and posts in one transaction) ---
+        with metrics.span("db_write", items=len(output_items)):
+            event_ids = await database.run_async(_save_results, output_items, cafe)
     except Exception as e:
         print(f"\n❌ Writing error: {e}")
-        return []
+        yield PipelineEvent("error", f"Writing error: {e}", target_date)
+        return
+
+    # The run is complete - its checkpoints are no longer needed
+    await database.run_async(checkpoints.complete_run, run_id)
+
+    # Items repeating an event of the same result are not saved (no id)
+    for item, event_id in zip(output_items, event_ids):
+        item['db_id'] = event_id
+    yield PipelineEvent("done", [item for item in output_items if item['db_id']], target_date)
+
+
+async def process_request(user_date_query, force_refresh=False, resume=True, cafe=None):
+    """Runs the pipeline for one date query and returns the saved items ([] on failure)."""
+    async for event in stream_request(user_date_query, force_refresh=force_refresh, resume=resume, cafe=cafe):
+        if event.stage == "done":
+            return event.data
+        if event.stage == "error":
+            return []
+    return []
+
+
+async def stream_requests(date_queries, max_concurrency=3, force_refresh=False, resume=True):
+    """Runs the pipeline for many date queries concurrently, merging their streams.
+
+    Yields (query, PipelineEvent) pairs as they happen - a failure of one date never cancels the others.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    queue = asyncio.Queue()
+
+    async def pump(query):
+        async with semaphore:
+            try:
+                async for event in stream_request(query, force_refresh=force_refresh, resume=resume):
+                    await queue.put((query, event))
+            except Exception as e:
+                await queue.put((query, PipelineEvent("error", str(e))))
+            finally:
+                await queue.put((query, None))
+
+    tasks = [asyncio.create_task(pump(query)) for query in date_queries]
+    running = len(tasks)
+    try:
+        while running:
+            query, event = await queue.get()
+            if event is None:
+                running -= 1
+                continue
+            yield query, event
+    finally:
+        # Stop the remaining dates if the consumer breaks out early
+        for task in tasks:
+            task.cancel()
+
+
+async def process_requests(date_queries, max_concurrency=3, force_refresh=False, resume=True):
+    """Runs the pipeline for many date queries concurrently and yields results as each one finishes.
+
+    Yields (query, items, error) tuples - a failure of one date never cancels the others.
+    """
+    async for query, event in stream_requests(date_queries, max_concurrency, force_refresh, resume):
+        if event.stage == "done":
+            yield query, event.data, None
+        elif event.stage == "error":
+            yield query, [], event.data
+
+
+async def stream_cafes(user_date_query, cafe_profiles, force_refresh=False, resume=True):
+    """Runs the pipeline for one date query and many cafés, merging their streams.
+
+    The research of a city is done once: the first café of each city runs the whole pipeline and, as soon
+    as its research is ready, the other cafés of that city start concurrently from it (impact and marketing
+    only). When the first café needs no research (stored bundle) or fails before it, the next one takes
+    its place. Yields (cafe_id, PipelineEvent) pairs as they happen.
+    """
+    queue = asyncio.Queue()
+
+    async def pump(cafe, research=None, on_research=None):
+        try:
+            async for event in stream_request(user_date_query, force_refresh=force_refresh, resume=resume,
+                                              cafe=cafe, research=research):
+                await queue.put((cafe.id, event))
+                if event.stage == "research" and on_research:
+                    on_research(event.data)
+                    on_research = None
+        except Exception as e:
+            await queue.put((cafe.id, PipelineEvent("error", str(e))))
+
+    async def run_city(group):
+        followers = []
+        pending = list(group)
+
+        def share(found_events):
+            followers.extend(asyncio.create_task(pump(cafe, research=found_events)) for cafe in pending)
+            pending.clear()
+
+        try:
+            while pending:
+                await pump(pending.pop(0), on_research=share)
+            await asyncio.gather(*followers)
+        finally:
+            await queue.put(None)
+
+    cities = {}
+    for cafe in cafe_profiles:
+        cities.setdefault(cafe.city, []).append(cafe)
+
+    tasks = [asyncio.create_task(run_city(group)) for group in cities.values()]
+    running = len(tasks)
+    try:
+        while running:
+            pair = await queue.get()
+            if pair is None:
+                running -= 1
+                continue
+            yield pair
+    finally:
+        # Stop the remaining cafés if the consumer breaks out early (gather cancels the followers)
+        for task in tasks:
+            task.cancel()
+
+
+def date_range(start_date, days):
+    """Returns a list of consecutive YYYY-MM-DD dates starting from start_date."""
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    return [(start + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(days)]
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CrowdBrew - terminal mode")
+    parser.add_argument("--dates", nargs="+", help="Date queries to process in batch mode")
+    parser.add_argument("--start", help="First date (YYYY-MM-DD) of a batch date range")
+    parser.add_argument("--days", type=int, default=7, help="Number of days in the date range (default: 7)")
+    parser.add_argument("--concurrency", type=int, default=3, help="Maximum number of dates processed at once")
+    parser.add_argument("--force-refresh", action="store_true", help="Run the agents even if a fresh bundle is stored")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Start from scratch instead of resuming an unfinished run from its checkpoints")
+    parser.add_argument("--ingest-feeds", nargs="?", const=feeds.FEEDS_DIR, metavar="DIR",
+                        help=f"Index the ICS/CSV/JSON event feeds of a directory (default: {feeds.FEEDS_DIR})")
+    parser.add_argument("--cafes", nargs="+", metavar="ID",
+                        help=f"Make proposals for these café profiles ('all' for every one in {cafes.CAFES_FILE})")
+    parser.add_argument("--search", help="Search the archive of events, menus and posts instead of running the agents")
+    parser.add_argument("--kind", choices=search.KINDS, action="append", help="Search only these kinds of results")
+    parser.add_argument("--item-type", help="Search only menu items of this type (e.g. coffee, cake)")
+    args = parser.parse_args()
+
+    def main_search():
+        database.init_db()
+        hits = search.search(args.search, kinds=args.kind or search.KINDS, item_type=args.item_type)
+        print(f"🔎 {len(hits)} results for: {args.search}")
+        for hit in hits:
+            print(f"\n[{hit['kind']}] {hit['event_date']} | {hit['title']}")
+            if hit['title'] != hit['event_name']:
+                print(f"   📅 {hit['event_name']}")
+            print(f"   {hit['snippet']}")
+
     async def main_cli():
         print("💽 Terminal Mode")
         query = input("\n📅 Podaj zapytanie z datą: ")
-        results = await process_request(query)
+        queries = expand_queries([query])
+        if args.cafes:
+            await main_cafes(queries)
+            return
+        if len(queries) > 1:
+            await main_batch(queries)
+            return
+        results = await process_request(query, force_refresh=args.force_refresh, resume=not args.no_resume)
         print(f"\n✅ Completed. {len(results)} elements saved.")
-    asyncio.run(main_cli())
\ No newline at end of file
+
+    async def main_batch(queries):
+        from crowdbrew_agent import rate_limit
+
+        print(f"💽 Batch Mode: {len(queries)} dates, max {args.concurrency} at once")
+        # Batch runs give way to interactive requests in the shared rate limiter
+        rate_limit.PRIORITY.set(rate_limit.BATCH)
+        failed = []
+        async for query, results, error in process_requests(
+                queries, max_concurrency=args.concurrency, force_refresh=args.force_refresh,
+                resume=not args.no_resume):
+            if error:
+                failed.append(query)
+                print(f"\n❌ [{query}] Failed: {error}")
+            else:
+                print(f"\n✅ [{query}] Completed. {len(results)} elements saved.")
+        print(f"\n🏁 Batch finished. {len(queries) - len(failed)}/{len(queries)} dates succeeded.")
+
+    async def main_cafes(queries):
+        from crowdbrew_agent import rate_limit
+
+        try:
+            selected = cafes.select_cafes(args.cafes)
+        except KeyError as e:
+            raise SystemExit(f"❌ {e.args[0]}")
+
+        print(f"💽 Café Mode: {len(queries)} dates, {len(selected)} cafés")
+        if len(queries) > 1:
+            rate_limit.PRIORITY.set(rate_limit.BATCH)
+        for query in queries:
+            async for cafe_id, event in stream_cafes(query, selected, force_refresh=args.force_refresh,
+                                                     resume=not args.no_resume):
+                if event.stage == "done":
+                    print(f"\n✅ [{query}] {cafe_id}: {len(event.data)} elements saved.")
+                elif event.stage == "error":
+                    print(f"\n❌ [{query}] {cafe_id}: {event.data}")
+
+    def main_ingest():
+        database.init_db()
+        ingested = feeds.ingest_feeds(args.ingest_feeds)
+        for path, rows in ingested.items():
+            print(f"📥 {path}: {rows} events indexed")
+        print(f"✅ {len(ingested)} feed files indexed (unchanged files skipped).")
+
+    if args.ingest_feeds:
+        main_ingest()
+    elif args.search:
+        main_search()
+    elif args.dates or args.start:
+        queries = expand_queries(args.dates or [])
+        if args.start:
+            queries += date_range(args.start, args.days)
+        asyncio.run(main_cafes(queries) if args.cafes else main_batch(queries))
+    else:
+        asyncio.run(main_cli())
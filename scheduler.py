@@ -0,0 +1,148 @@
+import os
+import asyncio
+import argparse
+from datetime import datetime
+
+from main import BUNDLE_MAX_AGE_HOURS, date_range, process_request, stream_cafes
+from crowdbrew_agent import cafes, database
+
+# Pre-generation of the upcoming dates. The dates staff ask about (the next 7-14 days) are known in
+# advance, so their bundles are made off-peak and stored - interactive requests then hit the read-through
+# of the stored bundle instead of waiting for the agents.
+#
+#   python scheduler.py --once    # one pass over the window (for cron, e.g. "0 3 * * *")
+#   python scheduler.py           # long-running service, works during the off-peak hours only
+#
+# The web app can run the same service on its job loop (CROWDBREW_SCHEDULER=1), where the shared rate
+# limiter serves the interactive requests first.
+
+# Upcoming dates kept precomputed (today included)
+WINDOW_DAYS = int(os.getenv("CROWDBREW_SCHEDULE_DAYS", 10))
+
+# A stored bundle younger than this is left alone. It is shorter than BUNDLE_MAX_AGE_HOURS, so a bundle
+# made tonight is still served by the read-through during the next day.
+FRESH_HOURS = BUNDLE_MAX_AGE_HOURS - 24
+
+# Hours (local time, [start, end)) in which the service runs, e.g. "22-6" for a window over midnight
+OFF_PEAK_HOURS = os.getenv("CROWDBREW_OFF_PEAK_HOURS", "1-6")
+
+# Dates processed at once and per pass - keeps the pass well inside the per-minute and daily quota
+CONCURRENCY = int(os.getenv("CROWDBREW_SCHEDULE_CONCURRENCY", 1))
+MAX_DATES_PER_PASS = int(os.getenv("CROWDBREW_SCHEDULE_MAX_DATES", 14))
+
+# How often the service wakes up to check the clock and the window
+CHECK_INTERVAL_SECONDS = 15 * 60
+
+
+def is_off_peak(now=None):
+    """True when the hour of now (default: the current time) is inside OFF_PEAK_HOURS."""
+    start, end = (int(hour) for hour in OFF_PEAK_HOURS.split("-"))
+    hour = (now or datetime.now()).hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def upcoming_dates(days=WINDOW_DAYS):
+    """The rolling window: YYYY-MM-DD dates from today on."""
+    return date_range(datetime.now().strftime("%Y-%m-%d"), days)
+
+
+def _stored(date, cafe, max_age_hours=None):
+    if cafe.id == cafes.DEFAULT_CAFE_ID:
+        return database.get_marketing_bundles(date, max_age_hours=max_age_hours)
+    return cafes.get_cafe_bundles(cafe.id, date, max_age_hours=max_age_hours)
+
+
+def stale_dates(dates, cafe_profiles):
+    """Returns [(date, cafés without a fresh bundle, True if any of them has an older one)] of the window."""
+    database.init_db()
+    stale = []
+    for date in dates:
+        pending = [cafe for cafe in cafe_profiles if not _stored(date, cafe, max_age_hours=FRESH_HOURS)]
+        if pending:
+            stale.append((date, pending, any(_stored(date, cafe) for cafe in pending)))
+    return stale
+
+
+async def _precompute_date(date, cafe_profiles, refresh):
+    """Runs the pipeline for one date. Returns the number of cafés whose bundle was saved."""
+    # A bundle older than FRESH_HOURS would still be served by the read-through, so it is refreshed
+    # explicitly; a date without any bundle keeps the read-through off and can resume its checkpoints
+    if cafe_profiles == [cafes.DEFAULT_CAFE]:
+        return 1 if await process_request(date, force_refresh=refresh) else 0
+    saved = 0
+    async for cafe_id, event in stream_cafes(date, cafe_profiles, force_refresh=refresh):
+        if event.stage == "done":
+            saved += 1
+        elif event.stage == "error":
+            print(f"❌ [{date}] {cafe_id}: {event.data}")
+    return saved
+
+
+async def precompute(days=WINDOW_DAYS, cafe_profiles=None, concurrency=CONCURRENCY, max_dates=MAX_DATES_PER_PASS):
+    """One pass over the window: makes the bundles of the dates that are not fresh in the database.
+
+    Model calls are made with the batch priority, so interactive requests of the same process go first.
+    Returns {date: number of cafés saved} of the processed dates.
+    """
+    from crowdbrew_agent import rate_limit
+
+    rate_limit.PRIORITY.set(rate_limit.BATCH)
+    cafe_profiles = cafe_profiles or [cafes.DEFAULT_CAFE]
+    stale = (await database.run_async(stale_dates, upcoming_dates(days), cafe_profiles))[:max_dates]
+    if not stale:
+        print(f"🗓️ All {days} upcoming dates are fresh - nothing to precompute.")
+        return {}
+
+    print(f"🗓️ Precomputing {len(stale)} dates: {', '.join(date for date, _, _ in stale)}")
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(date, pending, refresh):
+        async with semaphore:
+            try:
+                return date, await _precompute_date(date, pending, refresh)
+            except Exception as e:
+                print(f"❌ [{date}] Precomputing failed: {e}")
+                return date, 0
+
+    results = dict(await asyncio.gather(*(run(date, pending, refresh) for date, pending, refresh in stale)))
+    print(f"🏁 Precomputed {sum(1 for saved in results.values() if saved)}/{len(results)} dates.")
+    return results
+
+
+async def serve(days=WINDOW_DAYS, cafe_profiles=None, concurrency=CONCURRENCY, max_dates=MAX_DATES_PER_PASS):
+    """Keeps the window precomputed: one pass whenever the service wakes up in the off-peak hours."""
+    print(f"⏰ Scheduler started: {days} upcoming dates, off-peak hours {OFF_PEAK_HOURS}.")
+    while True:
+        if is_off_peak():
+            try:
+                await precompute(days, cafe_profiles, concurrency, max_dates)
+            except Exception as e:
+                # A failed pass (e.g. database error) must not stop the service
+                print(f"❌ Scheduler pass failed: {e}")
+        await asyncio.sleep(CHECK_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CrowdBrew - pre-generation of the upcoming dates")
+    parser.add_argument("--once", action="store_true", help="Run one pass now and exit (for cron)")
+    parser.add_argument("--days", type=int, default=WINDOW_DAYS, help=f"Upcoming dates to keep (default: {WINDOW_DAYS})")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Dates processed at once")
+    parser.add_argument("--max-dates", type=int, default=MAX_DATES_PER_PASS, help="Dates processed in one pass")
+    parser.add_argument("--cafes", nargs="+", metavar="ID", help="Café profiles to precompute ('all' for every one)")
+    parser.add_argument("--status", action="store_true", help="Only list the dates which are not fresh")
+    args = parser.parse_args()
+
+    try:
+        selected = cafes.select_cafes(args.cafes or [cafes.DEFAULT_CAFE_ID])
+    except KeyError as e:
+        raise SystemExit(f"❌ {e.args[0]}")
+
+    if args.status:
+        stale = stale_dates(upcoming_dates(args.days), selected)
+        for date, pending, _ in stale:
+            print(f"⏳ {date}: {', '.join(cafe.id for cafe in pending)}")
+        print(f"✅ {args.days - len(stale)}/{args.days} upcoming dates are fresh.")
+    elif args.once:
+        asyncio.run(precompute(args.days, selected, args.concurrency, args.max_dates))
+    else:
+        asyncio.run(serve(args.days, selected, args.concurrency, args.max_dates))
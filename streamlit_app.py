@@ -1,6 +1,141 @@
 import streamlit as st
-import asyncio
-from main import process_request 
+import jobs
+from crowdbrew_agent import database, metrics
+from main import expand_queries
+
+# Proposals per page of the history
+HISTORY_PAGE_SIZE = 10
+
+ITEM_TYPES = {"": "Wszystkie", "coffee": "☕ Kawa", "cake": "🍰 Ciasto"}
+
+
+def render_bundle(item, key_prefix="post"):
+    """Renders one proposal (event, scoring, menu and post) as a card.
+
+    Items read from the history come without the post - it is loaded from the database on demand.
+    """
+    with st.container(border=True):
+
+        st.markdown(f"""
+        <div class="card-header">
+            <h3>📅 {item.get('event_date')} | {item.get('event_name')}</h3>
+            <p>📍 {item.get('location')}</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+        # Scoring and charts
+        score = item.get('impact_score', 0)
+        breakdown = item.get('score_breakdown', {})
+
+        # Explainable AI
+        if score > 0:
+            col1, col2 = st.columns([0.7, 0.3])
+            with col1:
+                st.write(f"**{item.get('description')}**")
+            with col2:
+                st.metric(label="Potencjał Biznesowy", value=f"{score}/100")
+
+            # Progress bar
+            st.progress(score)
+
+            # Expandable details
+            with st.expander("📊 Dlaczego AI wybrało to wydarzenie? (Analiza)"):
+                for key, val in breakdown.items():
+                    col_lbl, col_bar = st.columns([0.4, 0.6])
+                    with col_lbl:
+                        st.caption(key.upper())
+                    with col_bar:
+                        # Normalize 0-20 to 0-1.0
+                        norm_val = min(val / 20.0, 1.0)
+                        st.progress(norm_val)
+
+                st.markdown("---")
+                st.markdown("**🧠 Uzasadnienie stratega:**")
+                st.info(item.get('comments', "Brak szczegółowego uzasadnienia."))
+        else:
+            # Fallback for old entries without scoring
+            st.write(item.get('description'))
+
+        st.markdown("<hr><h4>🍰 Menu Specjalne:</h4>", unsafe_allow_html=True)
+
+        # Menu (columns)
+        cols = st.columns(2)
+        menu = item.get('menu_items', [])
+
+        if len(menu) > 0:
+            with cols[0]:
+                st.info(f"☕ **{menu[0].get('name')}**\n\n{menu[0].get('desc')}")
+        if len(menu) > 1:
+            with cols[1]:
+                st.warning(f"🍰 **{menu[1].get('name')}**\n\n{menu[1].get('desc')}")
+
+        # 4. Post section (dynamic height)
+        if 'facebook_post' in item:
+            post_content = item['facebook_post']
+        elif st.toggle("📝 Pokaż post na Facebooka", key=f"{key_prefix}_show_{item.get('db_id')}"):
+            post_content = load_post(item.get('db_id'), database.history_version())
+        else:
+            return
+        # Height algorithm: 50px base + 25px for every 60 characters
+        calc_height = 50 + (len(post_content) // 60) * 25
+
+        st.text_area(
+            "Post na Facebooka:", 
+            value=post_content, 
+            height=calc_height, 
+            key=f"{key_prefix}_{item.get('event_date')}_{item.get('event_name')}"
+        )
+
+
+# --- HISTORY ---
+# Database reads are cached by the data version: every saved result writes new posts, so the cached pages of
+# an older version are never served again and drop out through max_entries. Nothing clears the caches: they are
+# shared by all sessions, and every rerun replays the "done" events of the finished jobs
+@st.cache_data(max_entries=100, show_spinner=False)
+def load_history_page(version, after, min_score, item_type):
+    return database.get_history_page(after=after, limit=HISTORY_PAGE_SIZE + 1,
+                                     min_score=min_score, item_type=item_type)
+
+
+@st.cache_data(max_entries=500, show_spinner=False)
+def load_post(event_id, version):
+    return database.get_post(event_id)
+
+
+def render_history():
+    """Browses the saved proposals page by page (newest dates first) - no model calls."""
+    col_score, col_type = st.columns(2)
+    with col_score:
+        min_score = st.slider("Minimalny potencjał biznesowy", 0, 100, 0, step=5)
+    with col_type:
+        item_type = st.selectbox("Pozycja w menu", list(ITEM_TYPES), format_func=ITEM_TYPES.get)
+
+    # Keyset pagination: the cursor of every visited page, reset when the filters change
+    filters = (min_score, item_type)
+    if st.session_state.get("history_filters") != filters:
+        st.session_state.history_filters = filters
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+
+    page = load_history_page(database.history_version(), cursors[-1], min_score or None, item_type or None)
+    has_more = len(page) > HISTORY_PAGE_SIZE
+    page = page[:HISTORY_PAGE_SIZE]
+    if not page:
+        st.caption("Brak zapisanych propozycji dla tych filtrów.")
+
+    for item in page:
+        render_bundle(item, key_prefix="history")
+
+    # The page changes in the button callbacks, before the next run renders it
+    col_newer, col_page, col_older = st.columns([0.35, 0.3, 0.35])
+    with col_newer:
+        st.button("⬅️ Nowsze", disabled=len(cursors) == 1, on_click=cursors.pop)
+    with col_page:
+        st.caption(f"Strona {len(cursors)}")
+    with col_older:
+        st.button("Starsze ➡️", disabled=not has_more, on_click=cursors.append,
+                  args=((page[-1]["event_date"], page[-1]["db_id"]) if page else None,))
+
 
 st.set_page_config(
     page_title="CrowdBrew",
@@ -54,94 +189,81 @@ st.markdown("""
 st.title("☕ CrowdBrew")
 st.subheader("Asystent promocyjnego menu dla kawiarni")
 
-# --- INPUT ---
-with st.form("search_form"):
-    date_query = st.text_input("Na kiedy szukamy wydarzeń?", placeholder="np. 13 grudnia 2025")
-    submitted = st.form_submit_button("🔍 Znajdź wydarzenia i stwórz menu")
+database.init_db()
+if jobs.SCHEDULER_ENABLED:
+    jobs.start_scheduler()
+tab_generate, tab_history = st.tabs(["🔍 Nowe propozycje", "🗂️ Historia"])
+
+# The history is rendered first - the generator tab below keeps the script busy while it follows the jobs
+with tab_history:
+    render_history()
+
+with tab_generate:
+    # --- INPUT ---
+    with st.form("search_form"):
+        date_query = st.text_input("Na kiedy szukamy wydarzeń?", placeholder="np. 13 grudnia 2025")
+        force_refresh = st.checkbox("Wygeneruj od nowa (pomiń zapisane propozycje)")
+        submitted = st.form_submit_button("🔍 Znajdź wydarzenia i stwórz menu")
+
+    # --- APPLICATION LOGIC ---
+    # The pipelines run as background jobs - the page only follows them, so it can be refreshed at any time
+    if submitted and date_query:
+        st.session_state.job_ids = [jobs.submit(query, force_refresh=force_refresh)
+                                    for query in expand_queries([date_query])]
+
+    job_ids = st.session_state.get("job_ids", [])
+    if job_ids:
+        status = st.status('CrowdBrew przeszukuje Łódź i parzy kawę... (pełne przetwarzanie trwa ok. 20-30s)', expanded=True)
+        saved_count = 0
+        errors = []
 
-# --- APPLICATION LOGIC ---
-if submitted and date_query:
-    with st.spinner('CrowdBrew przeszukuje Łódź i parzy kawę... (to potrwa ok. 20-30s)'):
         try:
-            results = asyncio.run(process_request(date_query))
-            
-            if not results:
-                st.error("Asystent nie znalazł wydarzeń lub wystąpił błąd parsowania. Spróbuj innej daty.")
-            else:
-                st.success(f"Sukces! Znaleziono i zapisano {len(results)} propozycji.")
-                
-                # --- RESULTS LOOP ---
-                for item in results:
-
-                    with st.container(border=True):
-                        
-                        st.markdown(f"""
-                        <div class="card-header">
-                            <h3>📅 {item.get('event_date')} | {item.get('event_name')}</h3>
-                            <p>📍 {item.get('location')}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-
-                        # Scoring and charts
-                        score = item.get('impact_score', 0)
-                        breakdown = item.get('score_breakdown', {})
-
-                        # Explainable AI
-                        if score > 0:
-                            col1, col2 = st.columns([0.7, 0.3])
-                            with col1:
-                                st.write(f"**{item.get('description')}**")
-                            with col2:
-                                st.metric(label="Potencjał Biznesowy", value=f"{score}/100")
-                            
-                            # Progress bar
-                            st.progress(score)
-                            
-                            # Expandable details
-                            with st.expander("📊 Dlaczego AI wybrało to wydarzenie? (Analiza)"):
-                                for key, val in breakdown.items():
-                                    col_lbl, col_bar = st.columns([0.4, 0.6])
-                                    with col_lbl:
-                                        st.caption(key.upper())
-                                    with col_bar:
-                                        # Normalize 0-20 to 0-1.0
-                                        norm_val = min(val / 20.0, 1.0)
-                                        st.progress(norm_val)
-
-                                st.markdown("---")
-                                st.markdown("**🧠 Uzasadnienie stratega:**")
-                                st.info(item.get('comments', "Brak szczegółowego uzasadnienia."))
-                        else:
-                            # Fallback for old entries without scoring
-                            st.write(item.get('description'))
-
-                        st.markdown("<hr><h4>🍰 Menu Specjalne:</h4>", unsafe_allow_html=True)
-                        
-                        # Menu (columns)
-                        cols = st.columns(2)
-                        menu = item.get('menu_items', [])
-                        
-                        if len(menu) > 0:
-                            with cols[0]:
-                                st.info(f"☕ **{menu[0].get('name')}**\n\n{menu[0].get('desc')}")
-                        if len(menu) > 1:
-                            with cols[1]:
-                                st.warning(f"🍰 **{menu[1].get('name')}**\n\n{menu[1].get('desc')}")
-                                
-                        # 4. Post section (dynamic height)
-                        post_content = item.get('facebook_post', '')
-                        # Height algorithm: 50px base + 25px for every 60 characters
-                        calc_height = 50 + (len(post_content) // 60) * 25
-                        
-                        st.text_area(
-                            "Post na Facebooka:", 
-                            value=post_content, 
-                            height=calc_height, 
-                            key=f"post_{item.get('event_name')}"
-                        )
+            # Results are rendered stage by stage, as soon as the agents deliver them
+            for query, event in jobs.stream(job_ids):
+                label = f"[{event.date or query}]"
 
+                if event.stage == "stored":
+                    status.write(f"⚡ {label} Wczytano {len(event.data)} zapisanych propozycji (bez użycia AI).")
+                elif event.stage == "research":
+                    names = ", ".join(found.get('event_name', '?') for found in event.data)
+                    status.write(f"🕵️ {label} Znaleziono {len(event.data)} wydarzeń: {names}")
+                elif event.stage == "impact":
+                    ranking = ", ".join(f"{top.get('event_name', '?')} ({top.get('impact_score', '?')}/100)" for top in event.data)
+                    status.write(f"🧠 {label} Największy potencjał: {ranking}")
+                elif event.stage == "bundle":
+                    render_bundle(event.data)
+                elif event.stage == "done":
+                    saved_count += len(event.data)
+                    status.write(f"💾 {label} Zapisano {len(event.data)} propozycji.")
+                elif event.stage == "error":
+                    errors.append(f"{label} {event.data}")
+                    status.write(f"❌ {label} {event.data}")
+
+            status.update(
+                label=f"Gotowe! Propozycje: {saved_count}",
+                state="error" if errors and not saved_count else "complete",
+                expanded=False
+            )
         except Exception as e:
+            status.update(label="Wystąpił błąd", state="error")
             st.error(f"Wystąpił nieoczekiwany błąd: {e}")
+        else:
+            if saved_count:
+                st.success(f"Sukces! Znaleziono i zapisano {saved_count} propozycji.")
+                for error in errors:
+                    st.warning(error)
+            else:
+                st.error("Asystent nie znalazł wydarzeń lub wystąpił błąd parsowania. Spróbuj innej daty.")
+
+# --- STATISTICS ---
+with st.sidebar:
+    st.header("📈 Statystyki")
+    stage_stats = metrics.summary()
+    if stage_stats:
+        st.caption("Czas etapów (ms, p50/p95), średnie zużycie tokenów, wyszukiwania, ponowienia i trafienia w cache.")
+        st.dataframe(stage_stats, hide_index=True)
+    else:
+        st.caption("Brak pomiarów - uruchom asystenta.")
 
 # Footer
 st.markdown("---")